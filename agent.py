@@ -1,6 +1,7 @@
 # Standard library imports
 import os
 import sys
+import argparse
 if sys.platform == 'win32':
     import msvcrt  # For Windows
 import sys
@@ -15,10 +16,27 @@ from langchain_core.prompts import ChatPromptTemplate
 from dotenv import load_dotenv
 from martypy import Marty
 import time
+from contextlib import contextmanager, ExitStack
 
 # Local imports
+import transcriber
 from transcriber import transcribe_audio
 from simple_recorder import record_audio
+from session_recorder import SessionRecorder
+from speech_timing import SpeechTimer
+from choreography import Choreography
+from model_router import ModelRouter, default_providers
+from profiler import StageProfiler
+from phrase_bank import PhraseBank
+from emotion_classifier import classify_emotion, express_emotion
+from speculative import PartialTranscriber, SpeculativeResponder
+from listen_gate import ListenGate
+from tool_selector import ToolSelector
+from audio_stream import StreamingSpeaker
+from latency_budget import TurnBudget
+from robot_state import TrackedMarty
+from func_def import ASSISTANT_SYSTEM_PROMPT, STORYTELLER_SYSTEM_PROMPT, STORYTELLER_USER_PROMPT, COLOR_TO_EMOTION
+from concurrent.futures import ThreadPoolExecutor
 from langchain_groq import ChatGroq
 from langchain_core.tools import tool
 from pydantic import BaseModel, Field
@@ -118,9 +136,12 @@ class MartyWaveArgs(BaseModel):
     side: str = Field(default="right", description="Which arm to wave with - 'left' or 'right'")
 
 #Connection to my WIFI, Ajumon S22 Ultra as this is used to initialize and return an instance of Marty
+MARTY_IP = "192.168.130.234"
+
 def get_marty():
     """Initialize and return the Marty robot instance"""
-    marty = Marty("wifi", "192.168.130.234")
+    # Commands that would not change the robot's state are skipped (see robot_state.py)
+    marty = TrackedMarty(Marty("wifi", MARTY_IP))
     marty.set_blocking(True) #ensures commands send to the robot wait for completion before returning control to the program and makes it synchronous
     return marty
 
@@ -377,40 +398,41 @@ def get_ready():
 @tool
 def select_color_and_tell_story():
     """When the user asks Marty to select a color and tell a story, this tool is used."""
-    my_marty.get_ready()
 
-    # Map color to emotion 
-    
-    color_to_emotion = {
-        "red": "Adventure",
-        "blue": "Magic",
-        "green": "Adventure",
-        "yellow": "Comedy",
-        "purple": "Fantasy",
-    }
     # speak_text("""Red means Adventure. Blue is for magic. Green is about Adventure. Yellow means Comedy. Purple is Fantasy""");
-    my_marty.walk(num_steps=5, start_foot="auto", step_length=25, move_time=1500)
-    my_marty.get_ready()
+    # Walk up to the color card as one compiled sequence instead of separate blocking calls
+    # The first get_ready is dropped when Marty is already standing ready
+    opening = Choreography().get_ready().walk(num_steps=5, start_foot="auto", step_length=25, move_time=1500).get_ready().compile(ready=my_marty.ready)
+    print("STORY OPENING", opening.stats)
+    opening.run(my_marty)
+    print(f"STORY OPENING took {opening.last_run_ms} ms")
     story_chain = get_storyteller_chain()
     detected_color = my_marty.get_color_sensor_color("left")
     print("DETECTED COLOR", detected_color)
-    story = story_chain.invoke({"emotion": color_to_emotion[detected_color] if detected_color in color_to_emotion else "neutral"})
+    story = story_chain.invoke({"emotion": COLOR_TO_EMOTION.get(detected_color, "neutral")})
     speak_text(story.content)
     return "celebrate"
 
 #These are the Snippet codes for the Action of the Robot implemented in Tools
+# Keep this list and its docstrings in step with func_def.ROBOT_TOOLS, which orchestrator.py offers
 tools = [walk, get_ready, select_color_and_tell_story, exit_program, dance, kick, lean, eyes, circle_dance, disco_color, wiggle, celebrate, wave, arms, move_joint, sidestep, ]
 
 
+# Routes every chain call to the fastest healthy LLM provider (OpenAI, and Groq when GROQ_API_KEY is set)
+model_router = ModelRouter(default_providers())
+
+# Sends only the tools relevant to each turn, with one-line descriptions
+tool_selector = ToolSelector(tools)
+
 #Storytelling Function
 def get_storyteller_chain():
     """Initialize and return the storyteller chain"""
     # storyteller_model = ChatGroq(model="llama-3.1-8b-instant", temperature=0)
-    storyteller_model = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-    storyteller_model = storyteller_model.bind_tools(tools)
+    # The story is plain text, so no tools are sent
+    storyteller_model = model_router.bind_tools([])
     storyteller_template = ChatPromptTemplate.from_messages([
-        ("system", "You are a story telling robot called Marty. Given the following genre, you need to tell a story that matches the genre. Keep the story short and concise. Break your conversations into length of 7."),
-        ("user", "Please tell a story that matches the genre: {emotion}. Start the story directly as though you are speaking to a child as Marty. Use short sentences no more than 7 words.")
+        ("system", STORYTELLER_SYSTEM_PROMPT),
+        ("user", STORYTELLER_USER_PROMPT)
     ])
     return storyteller_template | storyteller_model
 
@@ -419,17 +441,14 @@ def get_storyteller_chain():
 def get_friendly_assistant():
     """Initialize and return the friendly assistant chain"""
     # assistant_model = ChatGroq(model="llama-3.1-8b-instant", temperature=0)
-    assistant_model = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-    assistant_model = assistant_model.bind_tools(tools)
     # assistant_model = ChatOpenAI(model="gpt-4o-mini", temperature=0)
     friendly_system_1 = "You are a friendly assistant called Marty. you should detect the emotion of the user based on how they interact. you have to comfort them and cheer them up using less than 20 words"
-    system_2 = "You are a friendly assistant called Marty. Try and cheer them up. Use sentences that are less than 10 words. Short sentences. Use the tools provided to help them and follow their commands."
     assistant_template = ChatPromptTemplate.from_messages([
-        ("system", system_2 ),
+        ("system", ASSISTANT_SYSTEM_PROMPT),
         MessagesPlaceholder(variable_name="chat_history"),
         ("user", "{question}"),
     ])
-    return assistant_template | assistant_model
+    return tool_selector.chain(assistant_template, model_router.bind_tools)
 
 
 
@@ -439,6 +458,15 @@ friendly_assistant = get_friendly_assistant()
 
 # my_marty = None
 
+# Plays each synthesized clip right after the previous one ends, based on its real duration
+speech_timer = SpeechTimer(my_marty)
+
+# Greetings, goodbyes and fillers are stored on the robot and played by name (uploaded in main())
+phrase_bank = PhraseBank(my_marty, speech_timer=speech_timer, robot_id=MARTY_IP)
+
+# Set by --stream-audio: speech starts playing on the first synthesized frame (see audio_stream.py)
+streaming_speaker = None
+
 #Marty Speak is a Python Wrapper for its Functionality
 def speak(text: str, blocking: bool = True, wait_less = False):
     """
@@ -447,18 +475,16 @@ def speak(text: str, blocking: bool = True, wait_less = False):
     Args:
         text (str): The text to be spoken by Marty
         blocking (bool): Whether to wait for speech to complete before continuing
+        wait_less (bool): Return as soon as the clip is queued so the next one can be synthesized
     """
     if my_marty:
-        my_marty.speak_openai(text, blocking=blocking)
-        # Sleep based on the length of the text. Fix approximately how long an average word is
-        if not wait_less: #delay of 1 second
-            time.sleep(1)
-
-        # if wait_less:
-        #     # time.sleep(len(text) * 0.01)
-        #     pass
-        # else:
-        #     time.sleep(len(text) * 0.03)
+        # The clip is queued behind whatever Marty is currently saying.
+        # Phrases from the phrase bank are played from the robot's storage instead of being synthesized and sent
+        if not phrase_bank.play_text(text, wait=False):
+            (streaming_speaker or speech_timer).say(text)
+        # Wait until the clip has actually finished playing instead of a fixed delay
+        if blocking and not wait_less:
+            (streaming_speaker or speech_timer).wait()
     else:
         print(f"[Marty would say]: {text}")
 
@@ -504,10 +530,12 @@ def speak_text(text: str):
     
     # # Speak each chunk
     for chunk in chunks:
+        if not chunk.strip():
+            continue
         print(chunk)
-        my_marty.set_blocking(True)
         speak(chunk, wait_less=True, blocking=False)
-    my_marty.set_blocking(True)
+    # Return when the last chunk has finished so the next utterance or motion starts right after it
+    (streaming_speaker or speech_timer).wait()
  
 
 #Provides a standardized way of Structuring the output of various tool function
@@ -530,10 +558,67 @@ def invoke_tools(tools, message: AnyMessage) -> list[ToolResult]:
 
 messages = []
 
+# Runs the local emotion classifier alongside the assistant call, and Marty's expression of it
+emotion_executor = ThreadPoolExecutor(max_workers=1)
+
+def express_during_speech(emotion_name: str, gesture: bool, start_timeout: float = 2.0):
+    """Show the child's emotion on Marty as soon as the reply has started playing"""
+    give_up = time.monotonic() + start_timeout
+    while speech_timer.remaining() == 0 and time.monotonic() < give_up:
+        time.sleep(0.05)
+    try:
+        express_emotion(my_marty, emotion_name, gesture=gesture)
+    except Exception as e:
+        print(f"Could not express emotion: {e}")
+
+# Set MARTY_SESSION_DIR to record every turn for later replay (see session_recorder.py)
+session_recorder = SessionRecorder(os.getenv("MARTY_SESSION_DIR")) if os.getenv("MARTY_SESSION_DIR") else None
+
+# Set by --profile: per-stage CPU and memory profiling (see profiler.py)
+profiler = None
+
+# Set by --speculate: start the assistant request from stable partial transcripts (see speculative.py)
+speculator = None
+
+# Set by --gate: wait for speech before recording so silence never reaches Whisper (see listen_gate.py)
+listen_gate = None
+
+# Objects with begin_turn(), end_turn() and a stage(name) context manager, wrapped around every turn and stage
+stage_hooks = [session_recorder] if session_recorder else []
+
+# Deadlines for each stage of a turn, degrading gracefully when one runs over (see latency_budget.py)
+turn_budget = TurnBudget()
+stage_hooks.append(turn_budget)
+
+@contextmanager
+def stage(name: str):
+    """Run one stage of a conversation turn inside all registered stage hooks"""
+    with ExitStack() as stack:
+        for hook in stage_hooks:
+            stack.enter_context(hook.stage(name))
+        yield
+
+def begin_turn():
+    for hook in stage_hooks:
+        hook.begin_turn()
+
+def end_turn():
+    for hook in stage_hooks:
+        hook.end_turn()
+
+def say_fallback():
+    """Tell the child something went wrong instead of going silent"""
+    try:
+        speak(phrase_bank.phrases["oops"], blocking=False)
+    except Exception as e:
+        print(f"Could not say fallback phrase: {e}")
+
 def conversational_flow():
     """Handle one conversation cycle"""
     print("Starting conversation flow")
     global messages;
+    begin_turn()
+    partials = None
     try:
         # Clean up previous recording
         if os.path.exists("recording.mp3"):
@@ -542,38 +627,96 @@ def conversational_flow():
         if len(messages) > 12:
             messages = messages[-6:]
         
-        print("Listening... (Recording for 10 seconds)")
-        record_audio(duration=10)
+        if speculator:
+            speculator.begin_turn(messages)
+            partials = PartialTranscriber(speculator.on_partial)
+        on_chunk = partials.feed if partials else None
+        with stage("record_audio"):
+            if listen_gate:
+                recording, sample_rate = listen_gate.listen(on_chunk=on_chunk)
+            else:
+                print("Listening... (Recording for 10 seconds)")
+                recording, sample_rate = record_audio(duration=10, on_chunk=on_chunk)
+        if partials:
+            partials.stop()
         print("Recording complete")
+        turn_budget.start()
+        if session_recorder:
+            session_recorder.log_audio(recording, sample_rate)
         
         # Transcribe and generate response
-        transcription = transcribe_audio("recording.mp3")
+        audio_seconds = len(recording) / sample_rate
+        asr_model = turn_budget.asr_model(audio_seconds)
+        asr_cpu_start = time.process_time()
+        asr_start = time.monotonic()
+        with stage("transcribe_audio"):
+            transcription = transcribe_audio("recording.mp3", model_name=asr_model,
+                                             deadline_ms=int(turn_budget.stage_deadline("transcribe_audio") * 1000))
+        # A call that had to load the model says nothing about its speed
+        if transcriber.last_backend != "local_cold":
+            turn_budget.record_asr(asr_model, audio_seconds, time.monotonic() - asr_start)
+        # Only in-process passes cost this process CPU time
+        if listen_gate and transcriber.last_backend == "local":
+            listen_gate.add_asr_pass(time.process_time() - asr_cpu_start, time.monotonic() - asr_start)
         print(transcription)
+        if session_recorder:
+            session_recorder.log_transcript(transcription)
         if not transcription.strip():
             print("No speech detected, skipping...")
             return
             
         print("You said:", transcription)
         global BREAK_LOOP;
+        # Detect the child's emotion locally while the assistant request is in flight
+        emotion_future = emotion_executor.submit(classify_emotion, transcription, recording, sample_rate)
         # Get AI response and speak
-        result = friendly_assistant.invoke({"question": transcription, "chat_history": messages})
+        def ask():
+            if speculator:
+                return speculator.finish(transcription)
+            return friendly_assistant.invoke({"question": transcription, "chat_history": messages})
+        with stage("assistant"):
+            # A filler phrase covers a slow answer; if there is still no answer the child hears the fallback
+            result = turn_budget.call("assistant", profiler.profile_call("assistant", ask) if profiler else ask, filler=lambda: speak(phrase_bank.phrases["thinking"], blocking=False))
+        if result is None:
+            print("No answer within the latency budget")
+            say_fallback()
+            return
+        turn_budget.answered()
+        emotion = emotion_future.result()
+        print("Detected emotion:", emotion.emotion, emotion.confidence)
+        if session_recorder:
+            session_recorder.log_llm(messages, transcription, result)
         
         if result.tool_calls:
-            tool_results = invoke_tools(tools, result)
+            with stage("invoke_tools"):
+                tool_results = invoke_tools(tools, result)
+            if session_recorder:
+                session_recorder.log_tool_results(tool_results)
             if tool_results:
                 tool_result = tool_results[0]
                 if tool_result.result  == "celebrate":
-                    my_marty.celebrate()
-                    time.sleep(1)
+                    speech_timer.run_after_speech(my_marty.celebrate)
                     BREAK_LOOP = True
             print("Tool results:", tool_results)
         else:
             messages.append(result)
+            # Match eyes and LEDs to the child's emotion, with a gesture only when we are fairly sure.
+            # Sent in the background once the reply is playing, so it never delays the answer
+            gesture = emotion.confidence >= 0.6 and turn_budget.allow_gestures()
+            emotion_executor.submit(express_during_speech, emotion.emotion, gesture)
         # Speak the response
-            speak_text(result.content)
+            with stage("speak_text"):
+                speak_text(turn_budget.cap_reply(result.content))
         
     except Exception as e:
         print(f"Error in conversation flow: {e}")
+        if session_recorder:
+            session_recorder.log_error(e)
+        say_fallback()
+    finally:
+        if partials:
+            partials.stop()
+        end_turn()
 
 def check_key_press():
     # Cross-platform key check
@@ -597,6 +740,11 @@ def main():
     try:
         print("Program is running. Press 'q' to quit.")
         my_marty.set_volume(100)
+        try:
+            phrase_bank.prepare()
+        except Exception as e:
+            # Without the bank every phrase is simply synthesized when it is said
+            print(f"Could not prepare the phrase bank: {e}")
         greet()
         global BREAK_LOOP;
         BREAK_LOOP = False
@@ -614,9 +762,33 @@ def main():
     except Exception as e:
         print(f"Unexpected error: {e}")
     finally:
+        print("Model routing:", model_router.metrics())
+        print("Tool selection:", tool_selector.report())
+        print("Latency budget:", turn_budget.report())
+        print("Robot commands:", my_marty.report())
+        if profiler:
+            profiler.write_report()
+        if speculator:
+            print("Speculation:", speculator.report())
+        if listen_gate:
+            print("Listening gate:", listen_gate.report())
+        if streaming_speaker:
+            print("Audio streaming:", streaming_speaker.report())
         print("Goodbye!")
         speak("Goodbye! It was nice talking to you! See you soon!")
 
+def realtime_main():
+    """Run the conversation over the realtime speech-to-speech API instead of record/transcribe/chat/speak"""
+    from realtime_agent import RealtimeSession
+    try:
+        my_marty.set_volume(100)
+        # Share the speech timer so the story tool's speech queues behind the reply
+        RealtimeSession(tools, my_marty, should_stop=lambda: BREAK_LOOP, speech_timer=speech_timer).run()
+    except KeyboardInterrupt:
+        print("\nProgram interrupted by user")
+    finally:
+        print("Goodbye!")
+
 
 
 
@@ -671,6 +843,30 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Marty the storytelling robot")
+    parser.add_argument("--realtime", action="store_true", help="Use the realtime speech-to-speech API (set REALTIME_URL to use a mock server)")
+    parser.add_argument("--profile", action="store_true", help="Profile CPU and memory of each conversation stage and write a report on exit")
+    parser.add_argument("--profile-every", type=int, default=1, help="With --profile, only profile every Nth turn")
+    parser.add_argument("--speculate", action="store_true", help="Start the assistant request while the child is still talking")
+    parser.add_argument("--gate", action="store_true", help="Only record and transcribe when speech is detected")
+    parser.add_argument("--wake-word", help="With --gate, only listen after this word (e.g. Marty)")
+    parser.add_argument("--stream-audio", action="store_true", help="Stream synthesized speech to Marty frame by frame")
+    parser.add_argument("--budget", type=float, default=turn_budget.total, help="Seconds from the end of the child's speech until Marty answers")
+    args = parser.parse_args()
+    turn_budget.total = args.budget
+    if args.stream_audio:
+        streaming_speaker = StreamingSpeaker(my_marty, speech_timer)
+    if args.gate:
+        listen_gate = ListenGate(wake_word=args.wake_word)
+    if args.speculate:
+        speculator = SpeculativeResponder(friendly_assistant.invoke)
+    if args.profile:
+        profiler = StageProfiler(sample_every=args.profile_every)
+        # Outside the turn budget, so snapshot time is not counted against the stage deadlines
+        stage_hooks.insert(stage_hooks.index(turn_budget), profiler)
+    if args.realtime:
+        realtime_main()
+    else:
+        main()
     # test()
     # speak_text("hello")
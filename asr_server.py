@@ -0,0 +1,205 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import torch
+import whisper
+
+from transcriber import get_model
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+class TranscriptionRequest:
+    """One queued transcription, completed by the batching thread"""
+
+    def __init__(self, audio_file_path: str, deadline: float):
+        self.audio_file_path = audio_file_path
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+        self.done = threading.Event()
+        self.text = None
+        self.error = None
+
+    def finish(self, text: str = None, error: str = None) -> None:
+        self.text = text
+        self.error = error
+        self.done.set()
+
+class BatchingTranscriber:
+    """
+    Loads a Whisper model once and decodes queued requests in batches.
+
+    The batching thread waits for the first request, then keeps collecting requests
+    for up to batch_window seconds (or until max_batch requests are queued) and runs
+    them through the model in a single forward pass. Requests whose deadline has
+    already passed are failed without being decoded.
+    """
+
+    def __init__(self, model_name: str = "base", batch_window: float = 0.05, max_batch: int = 8, language: str = None):
+        self.model_name = model_name
+        self.model = get_model(model_name)
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.options = whisper.DecodingOptions(language=language, fp16=torch.cuda.is_available())
+        self.requests = queue.Queue()
+        self.metrics_lock = threading.Lock()
+        self.metrics = {"requests": 0, "batches": 0, "batched_requests": 0, "expired": 0, "errors": 0, "max_batch_size": 0}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, audio_file_path: str, deadline_ms: int = 10000) -> TranscriptionRequest:
+        request = TranscriptionRequest(audio_file_path, time.monotonic() + deadline_ms / 1000)
+        with self.metrics_lock:
+            self.metrics["requests"] += 1
+        self.requests.put(request)
+        return request
+
+    def snapshot(self) -> dict:
+        """Return the current queue depth and batching counters"""
+        with self.metrics_lock:
+            metrics = dict(self.metrics)
+        metrics["queue_depth"] = self.requests.qsize()
+        metrics["mean_batch_size"] = round(metrics["batched_requests"] / metrics["batches"], 2) if metrics["batches"] else 0
+        return metrics
+
+    def _collect_batch(self) -> list:
+        batch = [self.requests.get()]
+        window_end = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = window_end - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            now = time.monotonic()
+            live = []
+            for request in batch:
+                if request.deadline < now:
+                    request.finish(error="deadline exceeded before decoding")
+                    with self.metrics_lock:
+                        self.metrics["expired"] += 1
+                else:
+                    live.append(request)
+            if live:
+                self._decode(live)
+
+    def _decode(self, batch: list) -> None:
+        mels = []
+        decodable = []
+        for request in batch:
+            try:
+                audio = whisper.load_audio(request.audio_file_path)
+            except Exception as e:
+                request.finish(error=f"Error loading audio: {e}")
+                continue
+            # Clips longer than one 30 second window cannot be batched, decode them on their own
+            if len(audio) > whisper.audio.N_SAMPLES:
+                try:
+                    request.finish(text=self.model.transcribe(audio)["text"])
+                except Exception as e:
+                    request.finish(error=str(e))
+                continue
+            mels.append(whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), n_mels=self.model.dims.n_mels))
+            decodable.append(request)
+
+        if decodable:
+            try:
+                results = whisper.decode(self.model, torch.stack(mels).to(self.model.device), self.options)
+                for request, result in zip(decodable, results):
+                    request.finish(text=result.text)
+            except Exception as e:
+                for request in decodable:
+                    request.finish(error=str(e))
+                with self.metrics_lock:
+                    self.metrics["errors"] += 1
+
+        if not decodable:
+            # Nothing went through the batched forward pass, so this was not a batch
+            return
+        with self.metrics_lock:
+            self.metrics["batches"] += 1
+            self.metrics["batched_requests"] += len(decodable)
+            self.metrics["max_batch_size"] = max(self.metrics["max_batch_size"], len(decodable))
+
+def make_handler(transcriber: BatchingTranscriber):
+    class ASRRequestHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, body: dict) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok", "model": transcriber.model_name})
+            elif self.path == "/metrics":
+                self._send_json(200, transcriber.snapshot())
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/transcribe":
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                audio_file_path = body["path"]
+                deadline_ms = int(body.get("deadline_ms", 10000))
+            except (ValueError, KeyError) as e:
+                self._send_json(400, {"error": f"Bad request: {e}"})
+                return
+            if body.get("model", transcriber.model_name) != transcriber.model_name:
+                self._send_json(409, {"error": f"This worker serves Whisper '{transcriber.model_name}'", "model": transcriber.model_name})
+                return
+            if not os.path.exists(audio_file_path):
+                self._send_json(404, {"error": f"Audio file not found: {audio_file_path}"})
+                return
+
+            request = transcriber.submit(audio_file_path, deadline_ms)
+            if not request.done.wait(timeout=deadline_ms / 1000):
+                self._send_json(504, {"error": "deadline exceeded"})
+            elif request.error:
+                self._send_json(504 if "deadline" in request.error else 500, {"error": request.error})
+            else:
+                self._send_json(200, {"text": request.text, "model": transcriber.model_name,
+                                      "queue_ms": round((time.monotonic() - request.enqueued) * 1000, 1)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return ASRRequestHandler
+
+def serve(model_name: str = "base", host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, batch_window: float = 0.05, max_batch: int = 8) -> None:
+    transcriber = BatchingTranscriber(model_name, batch_window, max_batch)
+    server = ThreadingHTTPServer((host, port), make_handler(transcriber))
+    print(f"ASR worker serving Whisper '{model_name}' on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Whisper worker with dynamic batching")
+    parser.add_argument("-m", "--model", default="base", help="Whisper model to use (tiny, base, small, medium, large)")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--batch-window-ms", type=int, default=50, help="How long to wait for more requests to batch")
+    parser.add_argument("--max-batch", type=int, default=8)
+    args = parser.parse_args()
+    serve(args.model, args.host, args.port, args.batch_window_ms / 1000, args.max_batch)
@@ -0,0 +1,203 @@
+import os
+import queue
+import tempfile
+import threading
+import time
+
+import numpy as np
+from pydub import AudioSegment
+
+from http_clients import get_openai_client
+from speech_timing import SpeechTimer
+
+# Streamed TTS audio is 16-bit mono PCM at 24 kHz
+SAMPLE_RATE = 24000
+BYTES_PER_SECOND = SAMPLE_RATE * 2
+# MP3 bitrates frames can be encoded at, lowest first
+BITRATE_LADDER = ["24k", "32k", "48k", "64k"]
+# Frames are cut at the quietest 20 ms within this many milliseconds of their target length
+CUT_SEARCH_MS = 300
+CUT_WINDOW_BYTES = int(BYTES_PER_SECOND * 0.02) // 2 * 2
+
+def bitrate_bytes_per_second(bitrate: str) -> float:
+    return int(bitrate.rstrip("k")) * 1000 / 8
+
+def quietest_cut(pcm: bytes, start: int, end: int) -> int:
+    """Byte offset of the middle of the quietest 20 ms window of 16-bit PCM between start and end"""
+    samples = np.frombuffer(pcm[start:end], dtype=np.int16).astype(np.float32)
+    window = CUT_WINDOW_BYTES // 2
+    if len(samples) <= window:
+        return end
+    blocks = len(samples) // window
+    energy = (samples[:blocks * window].reshape(blocks, window) ** 2).mean(axis=1)
+    return start + (int(np.argmin(energy)) * window + window // 2) * 2
+
+class StreamingSpeaker:
+    """
+    Speaks text on Marty while it is still being synthesized.
+
+    The TTS response is streamed as PCM and cut into frames: a short first frame so
+    playback starts quickly, then longer ones. Frames are cut at the quietest point
+    near their target length, so the small gap and MP3 padding at every frame
+    boundary fall between words rather than in the middle of one. Each frame is
+    encoded as an MP3 and played with a SpeechTimer, which sends it start_latency
+    before the previous one ends, from a single player thread, so say() returns as
+    soon as synthesis has finished and the next sentence can be synthesized while
+    this one plays.
+
+    The bitrate of each frame is the highest in BITRATE_LADDER the link can carry
+    with some headroom, based on how long recent frames took to stream to the
+    robot (until play_mp3 returned). A frame that is ready too late to start when
+    the previous one ends counts as an underrun: the throughput estimate is lowered
+    and the jitter buffer, which holds the first `prebuffer` frames of every
+    utterance before playback starts, grows by a frame.
+    """
+
+    def __init__(self, marty, speech_timer: SpeechTimer = None, voice: str = "alloy", first_frame_ms: int = 400,
+                 frame_ms: int = 1200, bitrates: list = BITRATE_LADDER, prebuffer: int = 1, max_prebuffer: int = 3,
+                 headroom: float = 0.7):
+        """
+        Args:
+            marty: Connected Marty instance
+            speech_timer (SpeechTimer): Timer shared with the rest of Marty's speech (a new one if not given)
+            voice (str): OpenAI TTS voice
+            first_frame_ms (int): Length of the first frame of an utterance in milliseconds
+            frame_ms (int): Length of the following frames in milliseconds
+            bitrates (list): Bitrate ladder, lowest first
+            prebuffer (int): Frames buffered before an utterance starts playing
+            max_prebuffer (int): Largest the jitter buffer grows to after underruns
+            headroom (float): Share of the measured throughput a bitrate may use
+        """
+        self.marty = marty
+        self.speech_timer = speech_timer or SpeechTimer(marty)
+        self.voice = voice
+        self.first_frame_bytes = int(BYTES_PER_SECOND * first_frame_ms / 1000) // 2 * 2
+        self.frame_bytes = int(BYTES_PER_SECOND * frame_ms / 1000) // 2 * 2
+        self.bitrates = bitrates
+        self.prebuffer = prebuffer
+        self.max_prebuffer = max_prebuffer
+        self.headroom = headroom
+        self.throughput = None
+        self.frames = queue.Queue()
+        self.stats = {"utterances": 0, "frames": 0, "underruns": 0, "fallbacks": 0,
+                      "first_audio_ms": [], "bitrates": {bitrate: 0 for bitrate in bitrates}}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def choose_bitrate(self) -> str:
+        """Highest bitrate the measured throughput can carry, the middle one before anything was measured"""
+        if self.throughput is None:
+            return self.bitrates[len(self.bitrates) // 2]
+        usable = self.throughput * self.headroom
+        fitting = [bitrate for bitrate in self.bitrates if bitrate_bytes_per_second(bitrate) <= usable]
+        return fitting[-1] if fitting else self.bitrates[0]
+
+    def say(self, text: str, wait: bool = False) -> None:
+        """
+        Stream the speech for text to Marty and return once synthesis has finished.
+
+        Falls back to SpeechTimer.say if streaming fails before any audio arrived.
+        """
+        requested_at = time.perf_counter()
+        buffered = []
+        pcm = bytearray()
+        queued = 0
+
+        def flush() -> None:
+            nonlocal queued
+            for index, pending in enumerate(buffered):
+                self.frames.put((pending, queued == 0 and index == 0, requested_at))
+            queued += len(buffered)
+            buffered.clear()
+
+        def queue_frame(frame: bytes) -> None:
+            buffered.append(frame)
+            # Hold the first frames back until the jitter buffer is full
+            if queued or len(buffered) >= self.prebuffer:
+                flush()
+
+        try:
+            client = get_openai_client()
+            with client.audio.speech.with_streaming_response.create(
+                model="tts-1", voice=self.voice, input=text, response_format="pcm",
+            ) as response:
+                for chunk in response.iter_bytes(4096):
+                    pcm.extend(chunk)
+                    frame_bytes = self.frame_bytes if queued or buffered else self.first_frame_bytes
+                    # Wait for enough audio past the target to look for a pause (less for the first frame)
+                    search = min(int(BYTES_PER_SECOND * CUT_SEARCH_MS / 1000), frame_bytes // 2) // 2 * 2
+                    if len(pcm) >= frame_bytes + search:
+                        cut = quietest_cut(pcm, frame_bytes - search, frame_bytes + search)
+                        queue_frame(bytes(pcm[:cut]))
+                        del pcm[:cut]
+        except Exception as e:
+            if not queued and not buffered:
+                print(f"Streaming speech failed, synthesizing the whole clip: {e}")
+                self.stats["fallbacks"] += 1
+                self.speech_timer.say(text, wait=wait)
+                return
+            print(f"Streaming speech interrupted: {e}")
+
+        if pcm:
+            buffered.append(bytes(pcm))
+        # Short utterances may end before the jitter buffer is full
+        flush()
+        self.stats["utterances"] += 1
+        if wait:
+            self.wait()
+
+    def wait(self) -> None:
+        """Block until every queued frame has been played"""
+        self.frames.join()
+        self.speech_timer.wait()
+
+    def _run(self) -> None:
+        while True:
+            pcm, first, requested_at = self.frames.get()
+            try:
+                self._play_frame(pcm, first, requested_at)
+            except Exception as e:
+                print(f"Could not play audio frame: {e}")
+            finally:
+                self.frames.task_done()
+
+    def _play_frame(self, pcm: bytes, first: bool, requested_at: float) -> None:
+        bitrate = self.choose_bitrate()
+        fd, clip_file = tempfile.mkstemp(suffix=".mp3", prefix="marty_stream_")
+        os.close(fd)
+        AudioSegment(data=pcm, sample_width=2, frame_rate=SAMPLE_RATE, channels=1).export(clip_file, format="mp3", bitrate=bitrate)
+        size = os.path.getsize(clip_file)
+
+        if not first and self.speech_timer.remaining() < self.speech_timer.start_latency:
+            # Too late to start when the previous frame ends: Marty goes quiet waiting for this one
+            self.stats["underruns"] += 1
+            self.prebuffer = min(self.max_prebuffer, self.prebuffer + 1)
+            if self.throughput is not None:
+                self.throughput *= 0.7
+
+        duration = len(pcm) / BYTES_PER_SECOND
+        on_sent = lambda send_seconds: self._record_transfer(size, duration, bitrate, send_seconds)
+        self.speech_timer.play(clip_file, duration=duration, delete_after=True, on_sent=on_sent)
+
+        self.stats["frames"] += 1
+        self.stats["bitrates"][bitrate] += 1
+        if first:
+            self.stats["first_audio_ms"].append(round((time.perf_counter() - requested_at) * 1000))
+
+    def _record_transfer(self, size: int, duration: float, bitrate: str, send_seconds: float) -> None:
+        """Update the throughput estimate from how long the robot took to take a whole frame"""
+        measured = size / max(send_seconds, 1e-3)
+        if send_seconds <= duration:
+            # The robot may pace the stream at playback speed, so a frame sent in time only
+            # shows the link carries at least this bitrate
+            self.throughput = max(self.throughput or 0.0, measured, bitrate_bytes_per_second(bitrate) / self.headroom)
+        else:
+            self.throughput = measured if self.throughput is None else 0.7 * self.throughput + 0.3 * measured
+
+    def report(self) -> dict:
+        stats = dict(self.stats)
+        first_audio = stats.pop("first_audio_ms")
+        stats["mean_first_audio_ms"] = round(sum(first_audio) / len(first_audio)) if first_audio else None
+        stats["throughput_kbps"] = round(self.throughput * 8 / 1000, 1) if self.throughput else None
+        stats["prebuffer"] = self.prebuffer
+        return stats
@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from transcriber import get_model
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".flac")
+
+# Name of the Whisper model loaded by the current worker process
+_worker_model_name = None
+
+def _init_worker(model_name: str):
+    """Load the Whisper model once when a worker process starts"""
+    global _worker_model_name
+    # One process per core already uses every core, so each worker decodes on a single thread
+    import torch
+    torch.set_num_threads(1)
+    _worker_model_name = model_name
+    get_model(model_name)
+
+def _transcribe_file(audio_file_path: str) -> dict:
+    """Transcribe one file inside a worker process and return a JSON-ready result"""
+    start_time = time.perf_counter()
+    try:
+        result = get_model(_worker_model_name).transcribe(audio_file_path)
+        return {
+            "path": audio_file_path,
+            "model": _worker_model_name,
+            "text": result["text"],
+            "language": result.get("language"),
+            "seconds": round(time.perf_counter() - start_time, 3),
+        }
+    except Exception as e:
+        return {
+            "path": audio_file_path,
+            "model": _worker_model_name,
+            "error": str(e),
+            "seconds": round(time.perf_counter() - start_time, 3),
+        }
+
+def find_recordings(directory: str, extensions: tuple = AUDIO_EXTENSIONS) -> list:
+    """
+    Walk a directory and return every audio file in it, in a stable order.
+
+    Args:
+        directory (str): Root directory of the session archive
+        extensions (tuple): File extensions to include
+
+    Returns:
+        list: Sorted list of absolute audio file paths
+    """
+    if not os.path.isdir(directory):
+        raise FileNotFoundError(f"Recording directory not found: {directory}")
+
+    recordings = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.lower().endswith(extensions):
+                recordings.append(os.path.abspath(os.path.join(root, name)))
+    return sorted(recordings)
+
+def load_completed(output_file: str, model_name: str = "base") -> set:
+    """
+    Read an existing JSONL output file and return the paths already transcribed with model_name.
+
+    Failed entries, and entries of other models, are not counted as completed so they
+    are transcribed on the next run. A partially written last line (e.g. after a crash)
+    is ignored.
+    """
+    completed = set()
+    if not os.path.exists(output_file):
+        return completed
+
+    with open(output_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "error" not in entry and entry.get("model") == model_name:
+                completed.add(os.path.abspath(entry["path"]))
+    return completed
+
+def truncate_partial_line(output_file: str) -> None:
+    """Cut off a last line left half-written by a crash, so the next record starts on a line of its own"""
+    if not os.path.exists(output_file):
+        return
+    with open(output_file, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+def batch_transcribe(directory: str, output_file: str, model_name: str = "base", workers: int = None) -> dict:
+    """
+    Transcribe every recording under a directory using a pool of worker processes.
+
+    Each worker loads the Whisper model once. Results are appended to the JSONL
+    output file as soon as each file finishes, so an interrupted run can be resumed
+    by running the same command again. Files are only skipped if they were done
+    with the same model.
+
+    Args:
+        directory (str): Root directory of the session archive
+        output_file (str): JSONL file the results are appended to
+        model_name (str): Whisper model to use (tiny, base, small, medium, large)
+        workers (int): Number of worker processes (default: number of CPU cores)
+
+    Returns:
+        dict: Counts of transcribed, failed and skipped files
+    """
+    recordings = find_recordings(directory)
+    completed = load_completed(output_file, model_name)
+    pending = [path for path in recordings if path not in completed]
+    summary = {"transcribed": 0, "failed": 0, "skipped": len(recordings) - len(pending)}
+
+    print(f"Found {len(recordings)} recordings, {summary['skipped']} already done, {len(pending)} to transcribe")
+    if not pending:
+        return summary
+
+    workers = workers or os.cpu_count() or 1
+    start_time = time.perf_counter()
+    truncate_partial_line(output_file)
+    with open(output_file, "a", encoding="utf-8") as out, ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(model_name,),
+    ) as pool:
+        futures = [pool.submit(_transcribe_file, path) for path in pending]
+        for done, future in enumerate(as_completed(futures), start=1):
+            entry = future.result()
+            out.write(json.dumps(entry) + "\n")
+            out.flush()
+
+            if "error" in entry:
+                summary["failed"] += 1
+                print(f"[{done}/{len(pending)}] FAILED {entry['path']}: {entry['error']}")
+            else:
+                summary["transcribed"] += 1
+                print(f"[{done}/{len(pending)}] {entry['path']} ({entry['seconds']}s)")
+
+    print(f"Finished in {time.perf_counter() - start_time:.1f} seconds: {summary}")
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe a directory of session recordings with Whisper")
+    parser.add_argument("directory", help="Directory containing the recordings")
+    parser.add_argument("-o", "--output", default="transcripts.jsonl", help="JSONL file to append results to")
+    parser.add_argument("-m", "--model", default="base", help="Whisper model to use (tiny, base, small, medium, large)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Number of worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    batch_transcribe(args.directory, args.output, args.model, args.workers)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Union
+
+# Rough cost of one wireless command round-trip plus servo settle, in milliseconds
+COMMAND_OVERHEAD_MS = 150
+
+@dataclass
+class Keyframe:
+    """Move one joint to a position over move_time milliseconds"""
+    joint: Union[str, int]
+    position: int
+    move_time: int = 1000
+
+@dataclass
+class Action:
+    """A whole-body martypy command (walk, celebrate, get_ready, ...) that cannot be split into joints"""
+    method: str
+    args: tuple = ()
+    kwargs: dict = field(default_factory=dict)
+    duration: int = 0
+
+@dataclass
+class Step:
+    """One authored gesture call. Steps run one after another unless with_previous is set"""
+    keyframes: List[Keyframe] = field(default_factory=list)
+    action: Optional[Action] = None
+    with_previous: bool = False
+
+@dataclass
+class Command:
+    """A single martypy call in a compiled plan, sent at start_ms from the start of the plan"""
+    method: str
+    args: tuple
+    kwargs: dict
+    start_ms: int
+    duration_ms: int
+
+@dataclass
+class CompileStats:
+    commands_before: int
+    duration_before_ms: int
+    commands_after: int
+    duration_after_ms: int
+
+    def __str__(self):
+        return (f"{self.commands_before} commands / {self.duration_before_ms} ms -> "
+                f"{self.commands_after} commands / {self.duration_after_ms} ms")
+
+class Choreography:
+    """
+    Builder for a sequence of gestures, compiled into as few robot commands as possible.
+
+    Example:
+        choreo = Choreography()
+        choreo.get_ready()
+        choreo.arms(80, 80, 800)
+        choreo.eyes("excited", with_previous=True)
+        choreo.celebrate(3000)
+        plan = choreo.compile()
+        print(plan.stats)
+        plan.run(my_marty)
+    """
+
+    def __init__(self):
+        self.steps: List[Step] = []
+
+    def move_joint(self, joint_name_or_num: Union[str, int], position: int, move_time: int = 1000, with_previous: bool = False):
+        self.steps.append(Step([Keyframe(joint_name_or_num, position, move_time)], with_previous=with_previous))
+        return self
+
+    def arms(self, left_angle: int = 50, right_angle: int = 50, move_time: int = 1000, with_previous: bool = False):
+        self.steps.append(Step([
+            Keyframe("left arm", left_angle, move_time),
+            Keyframe("right arm", right_angle, move_time),
+        ], with_previous=with_previous))
+        return self
+
+    def eyes(self, pose_or_angle: Union[str, int] = "excited", move_time: int = 1000, with_previous: bool = False):
+        if isinstance(pose_or_angle, int):
+            return self.move_joint("eyes", pose_or_angle, move_time, with_previous)
+        return self.action("eyes", pose_or_angle, move_time, duration=move_time, with_previous=with_previous)
+
+    def get_ready(self, with_previous: bool = False):
+        return self.action("get_ready", duration=2000, with_previous=with_previous)
+
+    def walk(self, num_steps: int = 2, start_foot: str = "auto", turn: int = 0, step_length: int = 25, move_time: int = 1500):
+        return self.action("walk", num_steps, start_foot, turn, step_length, move_time, duration=num_steps * move_time)
+
+    def celebrate(self, move_time: int = 4000):
+        return self.action("celebrate", move_time, duration=move_time)
+
+    def action(self, method: str, *args, duration: int = 0, with_previous: bool = False, **kwargs):
+        self.steps.append(Step(action=Action(method, args, kwargs, duration), with_previous=with_previous))
+        return self
+
+    def compile(self, command_overhead_ms: int = COMMAND_OVERHEAD_MS, ready: bool = False) -> "CompiledChoreography":
+        return compile_choreography(self.steps, command_overhead_ms, ready)
+
+class CompiledChoreography:
+    """A timed list of robot commands produced by compile_choreography"""
+
+    def __init__(self, commands: List[Command], stats: CompileStats):
+        self.commands = commands
+        self.stats = stats
+        self.last_run_ms = None
+
+    def run(self, marty, poll_interval: float = 0.05) -> float:
+        """
+        Send the plan one time slot at a time without blocking and return how long it took in seconds.
+
+        When the robot has is_moving(), the next slot is sent as soon as Marty has stopped
+        moving, so a motion that finishes early (or a command the robot skipped) costs no
+        more than it takes. Otherwise each slot is given its compiled duration.
+        """
+        is_moving = getattr(marty, "is_moving", None)
+        slots = {}
+        for command in self.commands:
+            slots.setdefault(command.start_ms, []).append(command)
+
+        start_time = time.monotonic()
+        for start_ms in sorted(slots):
+            slot_start = time.monotonic()
+            for command in slots[start_ms]:
+                getattr(marty, command.method)(*command.args, **command.kwargs, blocking=False)
+            expected = max(command.duration_ms for command in slots[start_ms]) / 1000
+            if is_moving is None:
+                time.sleep(expected)
+            else:
+                _wait_until_still(is_moving, slot_start, expected, poll_interval)
+        elapsed = time.monotonic() - start_time
+        self.last_run_ms = round(elapsed * 1000)
+        return elapsed
+
+def _wait_until_still(is_moving, slot_start: float, expected: float, poll_interval: float) -> None:
+    """Poll is_moving until Marty stops, giving up at twice the expected duration"""
+    # Give the motion a moment to start before trusting a "not moving" answer
+    time.sleep(min(expected, 4 * poll_interval))
+    give_up = slot_start + 2 * expected + 1.0
+    while time.monotonic() < give_up:
+        try:
+            if not is_moving():
+                return
+        except Exception:
+            # No feedback from the robot: fall back to the compiled duration
+            time.sleep(max(0.0, slot_start + expected - time.monotonic()))
+            return
+        time.sleep(poll_interval)
+
+def _group_slots(steps: List[Step]) -> List[List[Step]]:
+    """Group steps into time slots: a step marked with_previous joins the slot before it"""
+    slots = []
+    for step in steps:
+        if step.with_previous and slots:
+            slots[-1].append(step)
+        else:
+            slots.append([step])
+    return slots
+
+def _authored_duration(step: Step) -> int:
+    if step.action:
+        return step.action.duration
+    return max(keyframe.move_time for keyframe in step.keyframes)
+
+def compile_choreography(steps: List[Step], command_overhead_ms: int = COMMAND_OVERHEAD_MS, ready: bool = False) -> CompiledChoreography:
+    """
+    Compile authored gesture steps into a single timed list of robot commands.
+
+    - Keyframes that move a joint to the position it was last commanded to, and eyes()
+      poses Marty already has, are dropped, and a time slot left with nothing to do is
+      removed entirely.
+    - Within a slot, only the last keyframe for each joint is kept.
+    - Left and right arm keyframes in the same slot with the same move time become one arms() call.
+    - A get_ready while Marty is already in the ready pose (after another get_ready with
+      no motion in between, or at the start when ready is True) is dropped.
+    - Commands are sent without blocking at their start offsets, so a slot costs its longest
+      move plus one round-trip instead of one round-trip and settle per call.
+
+    Args:
+        steps (list): Authored steps, e.g. Choreography().steps
+        command_overhead_ms (int): Assumed round-trip and settle cost per blocking command
+        ready (bool): Marty is known to be in the ready pose when the plan starts
+
+    Returns:
+        CompiledChoreography: The commands to send, with before/after statistics
+    """
+    commands_before = len(steps)
+    duration_before = sum(_authored_duration(step) + command_overhead_ms for step in steps)
+
+    commands: List[Command] = []
+    positions = {}
+    cursor = 0
+    for slot in _group_slots(steps):
+        slot_commands = []
+        targets = {}
+        for step in slot:
+            if step.action:
+                if step.action.method == "get_ready" and ready:
+                    continue
+                if step.action.method == "eyes":
+                    pose = step.action.args[0] if step.action.args else step.action.kwargs.get("pose_or_angle", "normal")
+                    if positions.get("eyes") == pose:
+                        continue
+                    slot_commands.append(Command("eyes", step.action.args, dict(step.action.kwargs), cursor, step.action.duration))
+                    positions["eyes"] = pose
+                    ready = False
+                    continue
+                slot_commands.append(Command(step.action.method, step.action.args, dict(step.action.kwargs), cursor, step.action.duration))
+                # Whole-body actions leave the joints in a position we do not track
+                positions.clear()
+                ready = step.action.method == "get_ready"
+            for keyframe in step.keyframes:
+                targets[keyframe.joint] = keyframe
+
+        # Drop joints that are already where they are being sent
+        targets = {joint: kf for joint, kf in targets.items() if positions.get(joint) != kf.position}
+        for joint, keyframe in targets.items():
+            positions[joint] = keyframe.position
+        if targets:
+            ready = False
+
+        left, right = targets.get("left arm"), targets.get("right arm")
+        if left and right and left.move_time == right.move_time:
+            slot_commands.append(Command("arms", (left.position, right.position, left.move_time), {}, cursor, left.move_time))
+            del targets["left arm"], targets["right arm"]
+        for joint, keyframe in targets.items():
+            slot_commands.append(Command("move_joint", (joint, keyframe.position, keyframe.move_time), {}, cursor, keyframe.move_time))
+
+        if not slot_commands:
+            continue
+        commands.extend(slot_commands)
+        cursor += max(command.duration_ms for command in slot_commands) + command_overhead_ms
+
+    stats = CompileStats(commands_before, duration_before, len(commands), cursor)
+    return CompiledChoreography(commands, stats)
@@ -76,4 +76,42 @@ class MartyCelebrateArgs(BaseModel):
 
 class MartyWaveArgs(BaseModel):
     """Arguments for making Marty wave"""
-    side: str = Field(default="right", description="Which arm to wave with - 'left' or 'right'")
\ No newline at end of file
+    side: str = Field(default="right", description="Which arm to wave with - 'left' or 'right'")
+
+class NoArgs(BaseModel):
+    """No arguments"""
+
+# Prompts and tools of the friendly assistant, shared by agent.py and orchestrator.py
+ASSISTANT_SYSTEM_PROMPT = "You are a friendly assistant called Marty. Try and cheer them up. Use sentences that are less than 10 words. Short sentences. Use the tools provided to help them and follow their commands."
+STORYTELLER_SYSTEM_PROMPT = "You are a story telling robot called Marty. Given the following genre, you need to tell a story that matches the genre. Keep the story short and concise. Break your conversations into length of 7."
+STORYTELLER_USER_PROMPT = "Please tell a story that matches the genre: {emotion}. Start the story directly as though you are speaking to a child as Marty. Use short sentences no more than 7 words."
+
+# Story genre for each color card Marty can detect
+COLOR_TO_EMOTION = {
+    "red": "Adventure",
+    "blue": "Magic",
+    "green": "Adventure",
+    "yellow": "Comedy",
+    "purple": "Fantasy",
+}
+
+# Tool name -> (argument model, description), in the order agent.py offers its tools.
+# The descriptions are the first lines of the agent.py tool docstrings.
+ROBOT_TOOLS = {
+    "walk": (MartyWalkArgs, "Tool to tell Marty to walk"),
+    "get_ready": (NoArgs, "Tool to tell Marty to get ready"),
+    "select_color_and_tell_story": (NoArgs, "When the user asks Marty to select a color and tell a story, this tool is used."),
+    "exit_program": (NoArgs, "Tool to exit the program"),
+    "dance": (MartyDanceArgs, "Tool to make Marty do a fun dance move"),
+    "kick": (MartyKickArgs, "Tool to make Marty kick"),
+    "lean": (MartyLeanArgs, "Tool to make Marty lean in a direction"),
+    "eyes": (MartyEyesArgs, "Tool to change Marty's eye expression"),
+    "circle_dance": (MartyCircleDanceArgs, "Tool to make Marty do a circle dance"),
+    "disco_color": (MartyDiscoColorArgs, "Tool to control Marty's disco LED lights"),
+    "wiggle": (MartyWiggleArgs, "Tool to make Marty do a wiggle movement"),
+    "celebrate": (MartyCelebrateArgs, "Tool to make Marty do a celebration movement"),
+    "wave": (MartyWaveArgs, "Tool to make Marty wave"),
+    "arms": (MartyArmsArgs, "Tool to move Marty's arms"),
+    "move_joint": (MartyMoveJointArgs, "Tool to precisely move a specific joint"),
+    "sidestep": (MartySidestepArgs, "Tool to make Marty step sideways"),
+}
@@ -0,0 +1,218 @@
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import openai
+from openai import OpenAI
+from langchain_openai import ChatOpenAI
+from langchain_core.runnables import RunnableLambda
+
+# Default time budget for one LLM or TTS call, including retries, in seconds
+DEFAULT_DEADLINE = 20.0
+
+_lock = threading.Lock()
+_http_client = None
+_openai_client = None
+_chat_models = {}
+# Threads running attempts, so a hedged request does not wait for a free thread
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="http-attempt")
+
+# Counters for every call made through call_with_retries, updated from many threads
+stats = {"calls": 0, "attempts": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "failures": 0}
+_stats_lock = threading.Lock()
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        stats[name] += 1
+
+def get_http_client() -> httpx.Client:
+    """Return the process-wide HTTP client, keeping TLS connections alive between calls"""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=120),
+                timeout=httpx.Timeout(DEFAULT_DEADLINE, connect=5.0),
+            )
+        return _http_client
+
+def get_openai_client() -> OpenAI:
+    """Return the shared OpenAI client. Retries are done by call_with_retries, not by the SDK"""
+    global _openai_client
+    http_client = get_http_client()
+    with _lock:
+        if _openai_client is None:
+            _openai_client = OpenAI(http_client=http_client, max_retries=0, timeout=DEFAULT_DEADLINE)
+        return _openai_client
+
+def get_chat_model(model: str = "gpt-4o-mini", temperature: float = 0, timeout: float = DEFAULT_DEADLINE) -> ChatOpenAI:
+    """Return a shared ChatOpenAI instance using the pooled HTTP client"""
+    key = (model, temperature, timeout)
+    http_client = get_http_client()
+    with _lock:
+        if key not in _chat_models:
+            _chat_models[key] = ChatOpenAI(model=model, temperature=temperature, timeout=timeout,
+                                           max_retries=0, http_client=http_client)
+        return _chat_models[key]
+
+def is_retryable(error: Exception) -> bool:
+    """Connection problems, timeouts, rate limits and server errors are worth retrying"""
+    if isinstance(error, (httpx.TransportError, openai.APIConnectionError, openai.APITimeoutError, TimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+def call_with_retries(fn, deadline: float = DEFAULT_DEADLINE, max_attempts: int = 3, base_delay: float = 0.2,
+                      max_delay: float = 2.0, hedge_after: float = None):
+    """
+    Call fn(timeout) until it succeeds, retrying with jittered backoff within a deadline.
+
+    Args:
+        fn: Callable taking the number of seconds left for this attempt
+        deadline (float): Total time allowed for all attempts, in seconds
+        max_attempts (int): Maximum number of attempts (not counting hedges)
+        base_delay (float): First backoff delay in seconds, doubled after each failure
+        max_delay (float): Upper bound for a backoff delay
+        hedge_after (float): If set, start a second copy of an attempt that has not
+            finished after this many seconds and use whichever answers first
+
+    Returns:
+        The value returned by fn
+
+    Raises:
+        TimeoutError: If the deadline passed before any attempt succeeded
+        Exception: The last error, if it was not retryable or all attempts failed
+    """
+    _count("calls")
+    end_time = time.monotonic() + deadline
+    last_error = None
+    for attempt in range(max_attempts):
+        remaining = end_time - time.monotonic()
+        if remaining <= 0:
+            break
+        if attempt:
+            _count("retries")
+        try:
+            return _attempt(fn, end_time, hedge_after)
+        except Exception as e:
+            last_error = e
+            if not is_retryable(e):
+                _count("failures")
+                raise
+        # Full jitter backoff, never sleeping past the deadline
+        delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+        time.sleep(max(0.0, min(delay, end_time - time.monotonic())))
+
+    _count("failures")
+    if last_error is None or isinstance(last_error, TimeoutError):
+        raise TimeoutError(f"Call did not finish within {deadline} seconds")
+    raise last_error
+
+def _attempt(fn, end_time: float, hedge_after: float = None):
+    """Run one attempt, hedged with a second copy if it is slow"""
+    _count("attempts")
+    first = _executor.submit(fn, end_time - time.monotonic())
+    if hedge_after is None or hedge_after >= end_time - time.monotonic():
+        return _result(first, end_time)
+
+    done, _ = wait([first], timeout=hedge_after)
+    if done:
+        return first.result()
+
+    _count("hedges")
+    _count("attempts")
+    second = _executor.submit(fn, end_time - time.monotonic())
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, end_time - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            raise TimeoutError("Hedged call timed out")
+        for future in done:
+            if future.exception() is None:
+                if future is second:
+                    _count("hedge_wins")
+                return future.result()
+            error = future.exception()
+    raise error
+
+def _result(future, end_time: float):
+    """Wait for an attempt until the deadline (raises TimeoutError when it passes)"""
+    return future.result(timeout=max(0.0, end_time - time.monotonic()))
+
+def resilient(runnable, deadline: float = DEFAULT_DEADLINE, max_attempts: int = 3, hedge_after: float = None):
+    """
+    Wrap a LangChain runnable (e.g. a chat model with bound tools) in call_with_retries.
+
+    Each attempt passes the time it has left as the request timeout, so an attempt
+    that is given up on is also cancelled by the HTTP client instead of holding an
+    executor thread until the provider's own timeout.
+    """
+    return RunnableLambda(lambda value: call_with_retries(
+        lambda timeout: runnable.invoke(value, timeout=max(0.1, timeout)),
+        deadline=deadline, max_attempts=max_attempts, hedge_after=hedge_after,
+    ), name="resilient")
+
+
+def run_stub_server(port: int = 8787, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0) -> ThreadingHTTPServer:
+    """
+    Start a local stand-in for the OpenAI API that injects latency and errors.
+
+    Serves /v1/chat/completions and /v1/audio/speech. Point the clients at it with
+    OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 to try retries and hedging.
+
+    Returns:
+        ThreadingHTTPServer: The running server (call shutdown() to stop it)
+    """
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency + random.uniform(0, jitter))
+            if random.random() < error_rate:
+                self._send(503, "application/json", json.dumps({"error": {"message": "injected error"}}).encode())
+            elif self.path.endswith("/audio/speech"):
+                self._send(200, "audio/mpeg", b"\xff\xfb\x90\x00" + b"\x00" * 413)
+            else:
+                self._send(200, "application/json", json.dumps({
+                    "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": "stub",
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": "Hello from the stub!"}}],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                }).encode())
+
+        def _send(self, status: int, content_type: str, data: bytes) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local OpenAI stub that injects latency and errors")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.3, help="Base latency per request in seconds")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Extra random latency per request in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.2, help="Fraction of requests answered with a 503")
+    args = parser.parse_args()
+    server = run_stub_server(args.port, args.latency, args.jitter, args.error_rate)
+    print(f"Stub OpenAI API on http://127.0.0.1:{args.port}/v1 (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,218 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+
+# Seconds each stage may take. record_audio is the child talking and tools and speech
+# take as long as the motion or reply, so those are not budgeted
+DEFAULT_STAGE_BUDGETS = {
+    "transcribe_audio": 2.0,
+    "assistant": 3.0,
+}
+# Whisper models from largest to smallest, for falling back to a faster one
+ASR_MODELS = ["medium", "small", "base", "tiny"]
+
+class TurnBudget:
+    """
+    Latency budget for one conversation turn, used as a stage hook in agent.py.
+
+    The turn gets `total` seconds from the end of the recording until Marty starts
+    answering, and every stage has its own allowance. Each stage is timed and
+    overruns are recorded per stage. The agent asks the budget how to degrade when
+    time is short:
+
+    - asr_model() picks a smaller Whisper model when the measured speed of the
+      default one would not fit the transcription allowance; a larger model that
+      was skipped reprobe_every times is tried again, in case it was only slow
+      for a while (e.g. while another program was busy)
+    - call() runs a slow stage with a deadline and plays a filler phrase if it is
+      still running after filler_after seconds
+    - cap_reply() shortens the reply when the turn is already late
+    - allow_gestures() skips optional gestures when the turn is already late
+    """
+
+    def __init__(self, total: float = 6.0, stage_budgets: dict = None, filler_after: float = 1.2,
+                 late_margin: float = 1.0, max_late_sentences: int = 2, reprobe_every: int = 20, patience: float = 20.0):
+        """
+        Args:
+            total (float): Seconds from the end of the recording to the start of the answer
+            stage_budgets (dict): Stage name -> seconds (default: DEFAULT_STAGE_BUDGETS)
+            filler_after (float): Seconds a call may run before a filler phrase is played
+            late_margin (float): The turn counts as late when less than this many seconds are left
+            max_late_sentences (int): Sentences kept from a reply when the turn is late
+            reprobe_every (int): Turns a too-slow Whisper model is skipped before it is measured again
+            patience (float): Seconds a call that has played its filler is waited for before it is given up
+        """
+        self.total = total
+        self.stage_budgets = dict(DEFAULT_STAGE_BUDGETS if stage_budgets is None else stage_budgets)
+        self.filler_after = filler_after
+        self.patience = patience
+        self.late_margin = late_margin
+        self.max_late_sentences = max_late_sentences
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="budget")
+        # Seconds of transcription per second of audio, per Whisper model
+        self.asr_speed = {}
+        self.reprobe_every = reprobe_every
+        self.asr_skips = {}
+        self.reprobing = set()
+        self.started = None
+        self.answered_remaining = None
+        self.stages = {}
+        self.degradations = {"smaller_asr": 0, "fillers": 0, "capped_replies": 0, "skipped_gestures": 0, "timeouts": 0,
+                             "late_answers": 0}
+        self.turns = 0
+        self.late_turns = 0
+
+    def begin_turn(self) -> None:
+        self.started = None
+        self.answered_remaining = None
+        self.turns += 1
+
+    def end_turn(self) -> None:
+        if self.answered_remaining is not None and self.answered_remaining < 0:
+            self.late_turns += 1
+
+    def start(self) -> None:
+        """Start the turn's clock, once the child has finished talking"""
+        self.started = time.monotonic()
+
+    def answered(self) -> None:
+        """Mark the moment Marty starts answering, which is what the total budget covers"""
+        self.answered_remaining = self.remaining()
+
+    def remaining(self) -> float:
+        if self.started is None:
+            return self.total
+        return self.total - (time.monotonic() - self.started)
+
+    def stage_deadline(self, name: str) -> float:
+        """Seconds the stage may take: its own allowance, limited by what is left of the turn"""
+        allowance = self.stage_budgets.get(name, self.total)
+        return max(0.1, min(allowance, self.remaining())) if self.started is not None else allowance
+
+    @contextmanager
+    def stage(self, name: str):
+        if name not in self.stage_budgets:
+            yield
+            return
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start_time
+            stats = self.stages.setdefault(name, {"runs": 0, "overruns": 0, "over_ms": 0.0, "max_ms": 0.0})
+            stats["runs"] += 1
+            stats["max_ms"] = max(stats["max_ms"], elapsed * 1000)
+            over = elapsed - self.stage_budgets[name]
+            if over > 0:
+                stats["overruns"] += 1
+                stats["over_ms"] += over * 1000
+                print(f"Stage {name} went {over * 1000:.0f} ms over its budget")
+
+    def record_asr(self, model_name: str, audio_seconds: float, elapsed: float) -> None:
+        """Update the measured speed of a Whisper model"""
+        if audio_seconds <= 0:
+            return
+        speed = elapsed / audio_seconds
+        previous = self.asr_speed.get(model_name)
+        # A re-measured model starts over, so one fast run is enough to bring it back
+        if previous is None or model_name in self.reprobing:
+            self.reprobing.discard(model_name)
+            self.asr_speed[model_name] = speed
+        else:
+            self.asr_speed[model_name] = 0.7 * previous + 0.3 * speed
+
+    def asr_model(self, audio_seconds: float, default: str = "base") -> str:
+        """The largest model, up to default, expected to transcribe the audio within the stage allowance"""
+        allowance = self.stage_deadline("transcribe_audio")
+        candidates = ASR_MODELS[ASR_MODELS.index(default):] if default in ASR_MODELS else [default]
+        for model_name in candidates:
+            speed = self.asr_speed.get(model_name)
+            # Unmeasured models are tried so their speed becomes known
+            fits = speed is None or speed * audio_seconds <= allowance
+            if not fits and model_name != candidates[-1]:
+                self.asr_skips[model_name] = self.asr_skips.get(model_name, 0) + 1
+                if self.asr_skips[model_name] >= self.reprobe_every:
+                    print(f"Measuring Whisper {model_name} again")
+                    self.reprobing.add(model_name)
+                    fits = True
+            if fits:
+                self.asr_skips[model_name] = 0
+                if model_name != default:
+                    self.degradations["smaller_asr"] += 1
+                    print(f"Using Whisper {model_name} to stay within the latency budget")
+                return model_name
+        self.degradations["smaller_asr"] += 1
+        return candidates[-1]
+
+    def call(self, name: str, fn, filler=None):
+        """
+        Run fn with the stage's deadline, playing filler() if it is slow.
+
+        Once the filler has played, the answer is still waited for up to `patience`
+        seconds: a slow provider (e.g. the local model) would otherwise have its
+        answer dropped while it keeps running and holds up the next turn.
+
+        Returns:
+            The result of fn, or None if it did not finish in time (it keeps running
+            in the background and its result is dropped)
+        """
+        future = self.executor.submit(fn)
+        deadline = self.stage_deadline(name)
+        try:
+            return future.result(timeout=min(self.filler_after, deadline) if filler else deadline)
+        except FutureTimeoutError:
+            if not filler:
+                self.degradations["timeouts"] += 1
+                return None
+        self.degradations["fillers"] += 1
+        try:
+            filler()
+        except Exception as e:
+            print(f"Could not play filler: {e}")
+        try:
+            # The filler bought the child some patience, so allow the full stage allowance
+            return future.result(timeout=max(0.1, self.stage_budgets.get(name, deadline) - self.filler_after))
+        except FutureTimeoutError:
+            pass
+        # Past the allowance, but the child has heard the filler: a late answer beats starting over
+        try:
+            result = future.result(timeout=max(0.1, self.patience - self.stage_budgets.get(name, deadline)))
+        except FutureTimeoutError:
+            self.degradations["timeouts"] += 1
+            return None
+        self.degradations["late_answers"] += 1
+        return result
+
+    def is_late(self) -> bool:
+        return self.started is not None and self.remaining() < self.late_margin
+
+    def cap_reply(self, text: str) -> str:
+        """Keep only the first few sentences of a reply when the turn is late"""
+        if not self.is_late():
+            return text
+        sentences = re.split(r"(?<=[.!?])\s+", text.strip())
+        if len(sentences) <= self.max_late_sentences:
+            return text
+        self.degradations["capped_replies"] += 1
+        return " ".join(sentences[:self.max_late_sentences])
+
+    def allow_gestures(self) -> bool:
+        """Optional gestures are skipped when the turn is late"""
+        if self.is_late():
+            self.degradations["skipped_gestures"] += 1
+            return False
+        return True
+
+    def report(self) -> dict:
+        return {
+            "turns": self.turns,
+            "late_turns": self.late_turns,
+            "stages": {
+                name: {"runs": stats["runs"], "overruns": stats["overruns"],
+                       "over_ms": round(stats["over_ms"]), "max_ms": round(stats["max_ms"])}
+                for name, stats in self.stages.items()
+            },
+            "degradations": dict(self.degradations),
+            "asr_speed": {name: round(speed, 3) for name, speed in self.asr_speed.items()},
+        }
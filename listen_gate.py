@@ -0,0 +1,231 @@
+import argparse
+import collections
+import json
+import os
+import time
+
+import numpy as np
+import sounddevice as sd
+
+from simple_recorder import record_audio, save_mp3
+from speculative import normalize
+from transcriber import get_model, transcribe_audio
+
+try:
+    import webrtcvad
+except ImportError:
+    webrtcvad = None
+
+# Measured cost of one cycle of the ungated record-and-transcribe loop, written by measure_ungated_cycle
+BASELINE_PATH = "listen_baseline.json"
+# record_audio stops after this many seconds of silence, which is how long an idle ungated recording lasts
+UNGATED_SILENCE_STOP = 2.0
+
+class ListenGate:
+    """
+    Low-power listening gate that only hands audio to ASR when someone is talking.
+
+    The microphone is read continuously in short frames. Each frame is first checked
+    against an energy threshold, and only loud frames are passed to webrtcvad (when
+    installed). An utterance starts once enough of the recent frames are speech, and
+    is recorded, together with a short pre-roll so the first word is not cut off,
+    until the speaker has been silent for silence_duration.
+
+    With a wake word set, utterances are checked with a tiny Whisper model and
+    dropped unless they contain it; after a match the gate stays open without the
+    wake word for follow_up seconds.
+
+    CPU time used while waiting is compared with the ASR passes the old
+    record-and-transcribe loop would have run over the same idle time. Idle, that
+    loop records until record_audio hears 2 seconds of silence and then transcribes
+    it; run `python listen_gate.py --baseline` in a quiet room to measure its cycle
+    length and ASR cost, otherwise they are estimated from the gated transcriptions.
+    """
+
+    def __init__(self, sample_rate: int = 16000, frame_ms: int = 30, energy_threshold: float = -45,
+                 vad_aggressiveness: int = 2, start_window: int = 10, start_frames: int = 6,
+                 pre_roll: float = 0.5, silence_duration: float = 1.5, max_duration: float = 10,
+                 wake_word: str = None, wake_model: str = "tiny", follow_up: float = 30, baseline_path: str = BASELINE_PATH):
+        """
+        Args:
+            sample_rate (int): Microphone sample rate (webrtcvad supports 8, 16, 32 and 48 kHz)
+            frame_ms (int): Frame length in milliseconds (webrtcvad supports 10, 20 and 30)
+            energy_threshold (float): Frames quieter than this (dBFS) are treated as silence without running VAD
+            vad_aggressiveness (int): webrtcvad aggressiveness from 0 (permissive) to 3 (strict)
+            start_window (int): Number of recent frames looked at to detect the start of speech
+            start_frames (int): Speech frames needed within the window to open the gate
+            pre_roll (float): Seconds of audio before the start of speech kept in the recording
+            silence_duration (float): Seconds of silence that end an utterance
+            max_duration (float): Maximum length of an utterance in seconds
+            wake_word (str): Optional word the child must say before Marty listens
+            wake_model (str): Whisper model used to spot the wake word
+            follow_up (float): Seconds after a wake word during which it is not needed again
+            baseline_path (str): JSON file with the measured ungated cycle (see measure_ungated_cycle)
+        """
+        self.sample_rate = sample_rate
+        self.frame_samples = int(sample_rate * frame_ms / 1000)
+        self.frame_duration = frame_ms / 1000
+        self.energy_threshold = energy_threshold
+        self.vad = webrtcvad.Vad(vad_aggressiveness) if webrtcvad else None
+        self.start_window = start_window
+        self.start_frames = start_frames
+        self.pre_roll_frames = int(pre_roll / self.frame_duration)
+        self.max_silent_frames = int(silence_duration / self.frame_duration)
+        self.max_frames = int(max_duration / self.frame_duration)
+        self.wake_word = normalize(wake_word) if wake_word else None
+        self.wake_model = wake_model
+        self.follow_up = follow_up
+        self.awake_until = 0.0
+        self.baseline = None
+        if os.path.exists(baseline_path):
+            with open(baseline_path, "r", encoding="utf-8") as f:
+                self.baseline = json.load(f)
+        self.stats = {"idle_s": 0.0, "gate_cpu_s": 0.0, "utterances": 0, "rejected": 0,
+                      "asr_passes": 0, "asr_cpu_s": 0.0, "asr_wall_s": 0.0}
+        if self.vad is None:
+            print("webrtcvad is not installed, the listening gate uses energy only")
+
+    def is_speech(self, frame: np.ndarray) -> bool:
+        """Cheap energy check first, VAD only on frames loud enough to be speech"""
+        samples = frame.astype(np.float32) / 32768.0
+        energy_db = 20 * np.log10(np.sqrt(np.mean(samples ** 2)) + 1e-10)
+        if energy_db < self.energy_threshold:
+            return False
+        if self.vad is None:
+            return True
+        try:
+            return self.vad.is_speech(frame.tobytes(), self.sample_rate)
+        except Exception:
+            return False
+
+    def _wait_for_speech(self, stream) -> list:
+        """Read frames until speech starts and return the pre-roll plus the first speech frames"""
+        recent = collections.deque(maxlen=self.pre_roll_frames + self.start_window)
+        flags = collections.deque(maxlen=self.start_window)
+        idle_start = time.monotonic()
+        cpu_start = time.process_time()
+        while True:
+            frame, _ = stream.read(self.frame_samples)
+            frame = frame.reshape(-1)
+            recent.append(frame)
+            flags.append(self.is_speech(frame))
+            if sum(flags) >= self.start_frames:
+                self.stats["idle_s"] += time.monotonic() - idle_start
+                self.stats["gate_cpu_s"] += time.process_time() - cpu_start
+                return list(recent)
+
+    def _record_utterance(self, stream, frames: list, on_chunk=None) -> np.ndarray:
+        if on_chunk:
+            for frame in frames:
+                on_chunk(frame, self.sample_rate)
+        silent_frames = 0
+        while len(frames) < self.max_frames and silent_frames < self.max_silent_frames:
+            frame, _ = stream.read(self.frame_samples)
+            frame = frame.reshape(-1)
+            frames.append(frame)
+            if on_chunk:
+                on_chunk(frame, self.sample_rate)
+            silent_frames = 0 if self.is_speech(frame) else silent_frames + 1
+        return np.concatenate(frames)
+
+    def _has_wake_word(self, recording: np.ndarray) -> bool:
+        cpu_start = time.process_time()
+        text = get_model(self.wake_model).transcribe(recording.astype(np.float32) / 32768.0, fp16=False)["text"]
+        self.stats["gate_cpu_s"] += time.process_time() - cpu_start
+        return self.wake_word in normalize(text)
+
+    def listen(self, on_chunk=None, path: str = "recording.mp3"):
+        """
+        Block until the child says something, then record it and save it to path.
+
+        Args:
+            on_chunk: Optional callable receiving each recorded frame and the sample rate
+            path (str): MP3 file the utterance is saved to for transcription
+
+        Returns:
+            (np.ndarray, int): The recording and its sample rate, like record_audio
+        """
+        print("Waiting for speech...")
+        with sd.InputStream(samplerate=self.sample_rate, channels=1, dtype=np.int16) as stream:
+            while True:
+                frames = self._wait_for_speech(stream)
+                recording = self._record_utterance(stream, frames, on_chunk)
+                if self.wake_word and time.monotonic() > self.awake_until and not self._has_wake_word(recording):
+                    self.stats["rejected"] += 1
+                    continue
+                self.awake_until = time.monotonic() + self.follow_up
+                break
+
+        self.stats["utterances"] += 1
+        print(f"Recorded {len(recording) / self.sample_rate:.2f} seconds of speech")
+        save_mp3(recording, self.sample_rate, path)
+        return recording, self.sample_rate
+
+    def add_asr_pass(self, cpu_seconds: float, wall_seconds: float = 0.0) -> None:
+        """Record the CPU and wall time of one transcription, used to estimate what idle listening would have cost"""
+        self.stats["asr_passes"] += 1
+        self.stats["asr_cpu_s"] += cpu_seconds
+        self.stats["asr_wall_s"] += wall_seconds
+
+    def report(self, ungated_cycle: float = None) -> dict:
+        """
+        CPU time saved per idle hour compared with the ungated record-and-transcribe loop.
+
+        Args:
+            ungated_cycle (float): Seconds per ungated cycle (default: the measured baseline,
+                or record_audio's silence cut-off plus the mean transcription time)
+        """
+        stats = dict(self.stats)
+        idle_hours = stats["idle_s"] / 3600
+        passes = stats["asr_passes"]
+        if self.baseline:
+            asr_cpu_per_pass = self.baseline["asr_cpu_per_pass_s"]
+            ungated_cycle = ungated_cycle or self.baseline["cycle_s"]
+        else:
+            asr_cpu_per_pass = stats["asr_cpu_s"] / passes if passes else 0.0
+            ungated_cycle = ungated_cycle or UNGATED_SILENCE_STOP + (stats["asr_wall_s"] / passes if passes else 0.0)
+        skipped_passes = stats["idle_s"] / ungated_cycle
+        saved = skipped_passes * asr_cpu_per_pass - stats["gate_cpu_s"]
+        stats.update({
+            "ungated_cycle_s": round(ungated_cycle, 2),
+            "baseline": "measured" if self.baseline else "estimated",
+            "asr_cpu_per_pass_s": round(asr_cpu_per_pass, 3),
+            "skipped_asr_passes": round(skipped_passes, 1),
+            "cpu_saved_s": round(saved, 1),
+            "cpu_saved_per_idle_hour_s": round(saved / idle_hours, 1) if idle_hours else 0.0,
+            "gate_cpu_per_idle_hour_s": round(stats["gate_cpu_s"] / idle_hours, 1) if idle_hours else 0.0,
+        })
+        for key in ("idle_s", "gate_cpu_s", "asr_cpu_s", "asr_wall_s"):
+            stats[key] = round(stats[key], 2)
+        return stats
+
+def measure_ungated_cycle(cycles: int = 3, model_name: str = "base", path: str = BASELINE_PATH) -> dict:
+    """
+    Run the ungated loop (record_audio, then transcribe) in a quiet room and save what one idle cycle costs.
+
+    Returns:
+        dict: Mean cycle_s (recording plus transcription) and asr_cpu_per_pass_s
+    """
+    # Load the model first, so the first cycle is not charged for it
+    get_model(model_name)
+    cycle_times, cpu_times = [], []
+    for _ in range(cycles):
+        start_time = time.monotonic()
+        record_audio(duration=10)
+        cpu_start = time.process_time()
+        transcribe_audio("recording.mp3", model_name=model_name, use_worker=False)
+        cpu_times.append(time.process_time() - cpu_start)
+        cycle_times.append(time.monotonic() - start_time)
+    baseline = {"cycle_s": round(sum(cycle_times) / cycles, 3), "asr_cpu_per_pass_s": round(sum(cpu_times) / cycles, 3),
+                "model": model_name, "cycles": cycles}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2)
+    print(f"Ungated baseline written to {path}:", baseline)
+    return baseline
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the ungated record-and-transcribe loop the listening gate is compared with")
+    parser.add_argument("--baseline", type=int, default=3, metavar="CYCLES", help="Number of idle cycles to measure")
+    parser.add_argument("-m", "--model", default="base", help="Whisper model the agent transcribes with")
+    args = parser.parse_args()
+    measure_ungated_cycle(args.baseline, args.model)
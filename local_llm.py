@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+# Quantized GGUF weights of the local model, e.g. a 4-bit Llama 3.2 3B or Qwen 2.5 3B Instruct
+LOCAL_LLM_PATH = os.getenv("LOCAL_LLM_PATH", "models/local-llm.gguf")
+
+TOOL_INSTRUCTIONS = (
+    "You can use these tools:\n{tools}\n"
+    "To use a tool, reply with only a JSON object like "
+    '{{"tool": "<tool name>", "args": {{<arguments>}}}} and nothing else. '
+    "Otherwise reply normally."
+)
+
+_llms = {}
+_llm_lock = threading.Lock()
+# A llama.cpp model is not thread-safe, so each one is used by a single call at a time
+_call_locks = {}
+
+def get_local_llm(model_path: str = LOCAL_LLM_PATH, n_ctx: int = 2048, n_threads: Optional[int] = None):
+    """Return the llama.cpp model for the given weights, loading it on first use"""
+    key = (model_path, n_ctx, n_threads)
+    with _llm_lock:
+        if key not in _llms:
+            try:
+                from llama_cpp import Llama
+            except ImportError:
+                raise ImportError("The local LLM backend needs llama-cpp-python: pip install llama-cpp-python")
+            _llms[key] = Llama(model_path=model_path, n_ctx=n_ctx, n_threads=n_threads, verbose=False)
+            _call_locks[key] = threading.Lock()
+        return _llms[key]
+
+def get_call_lock(model_path: str = LOCAL_LLM_PATH, n_ctx: int = 2048, n_threads: Optional[int] = None) -> threading.Lock:
+    """Lock to hold while generating with the model returned by get_local_llm for the same arguments"""
+    get_local_llm(model_path, n_ctx, n_threads)
+    return _call_locks[(model_path, n_ctx, n_threads)]
+
+def describe_tools(tools: list) -> str:
+    """One line per tool with its arguments, for the tool-use instructions"""
+    lines = []
+    for spec in tools:
+        function = spec["function"]
+        arguments = ", ".join(function.get("parameters", {}).get("properties", {}))
+        description = function.get("description", "").strip().splitlines()
+        lines.append(f"- {function['name']}({arguments}): {description[0] if description else ''}")
+    return "\n".join(lines)
+
+def parse_tool_calls(text: str, tool_names: set) -> AIMessage:
+    """
+    Turn the model's reply into an AIMessage, with tool_calls when it contains a tool call.
+
+    The first JSON object in the reply naming a known tool ({"tool": ..., "args": ...},
+    or the OpenAI style {"name": ..., "arguments": ...}) becomes the tool call; any
+    other text stays in the content.
+    """
+    decoder = json.JSONDecoder()
+    index = text.find("{")
+    while index != -1:
+        try:
+            value, end = decoder.raw_decode(text, index)
+        except json.JSONDecodeError:
+            index = text.find("{", index + 1)
+            continue
+        name = value.get("tool") or value.get("name") if isinstance(value, dict) else None
+        if name in tool_names:
+            args = value.get("args", value.get("arguments", {}))
+            if isinstance(args, str):
+                try:
+                    args = json.loads(args)
+                except json.JSONDecodeError:
+                    args = {}
+            content = (text[:index] + text[end:]).strip()
+            return AIMessage(content=content, tool_calls=[
+                {"name": name, "args": args if isinstance(args, dict) else {}, "id": f"call_{uuid.uuid4().hex[:12]}"}
+            ])
+        index = text.find("{", end)
+    return AIMessage(content=text.strip())
+
+def to_chat_messages(messages: List[BaseMessage], tools: Optional[list] = None) -> list:
+    """Convert LangChain messages to llama.cpp chat messages, adding the tool instructions to the system prompt"""
+    chat = []
+    for message in messages:
+        if isinstance(message, SystemMessage):
+            chat.append({"role": "system", "content": message.content})
+        elif isinstance(message, HumanMessage):
+            chat.append({"role": "user", "content": message.content})
+        elif isinstance(message, ToolMessage):
+            chat.append({"role": "user", "content": f"Tool result: {message.content}"})
+        elif isinstance(message, AIMessage):
+            calls = [json.dumps({"tool": call["name"], "args": call["args"]}) for call in message.tool_calls]
+            chat.append({"role": "assistant", "content": "\n".join([message.content] + calls).strip()})
+        else:
+            chat.append({"role": "user", "content": str(message.content)})
+
+    if tools:
+        instructions = TOOL_INSTRUCTIONS.format(tools=describe_tools(tools))
+        if chat and chat[0]["role"] == "system":
+            chat[0] = {"role": "system", "content": chat[0]["content"] + "\n\n" + instructions}
+        else:
+            chat.insert(0, {"role": "system", "content": instructions})
+    return chat
+
+class LocalChatModel(BaseChatModel):
+    """
+    Chat model served on the CPU by llama.cpp from local quantized weights.
+
+    Works anywhere a LangChain chat model does (prompt templates, bind_tools, the
+    model router). Small local models have no native function calling, so tools are
+    described in the system prompt and the JSON reply is parsed back into
+    AIMessage.tool_calls. Calls to the same model are serialized, since llama.cpp
+    models cannot be used from two threads at once.
+    """
+
+    model_path: str = LOCAL_LLM_PATH
+    n_ctx: int = 2048
+    n_threads: Optional[int] = None
+    max_tokens: int = 256
+    temperature: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "llama-cpp-local"
+
+    def bind_tools(self, tools: list, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _completion(self, messages: List[BaseMessage], stop: Optional[List[str]], tools: Optional[list], stream: bool):
+        llm = get_local_llm(self.model_path, self.n_ctx, self.n_threads)
+        return llm.create_chat_completion(
+            messages=to_chat_messages(messages, tools),
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            stop=stop,
+            stream=stream,
+        )
+
+    def _lock(self) -> threading.Lock:
+        return get_call_lock(self.model_path, self.n_ctx, self.n_threads)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                  tools: Optional[list] = None, **kwargs: Any) -> ChatResult:
+        with self._lock():
+            response = self._completion(messages, stop, tools, stream=False)
+        text = response["choices"][0]["message"]["content"] or ""
+        names = {spec["function"]["name"] for spec in tools or []}
+        message = parse_tool_calls(text, names) if names else AIMessage(content=text.strip())
+        message.usage_metadata = {
+            "input_tokens": response["usage"]["prompt_tokens"],
+            "output_tokens": response["usage"]["completion_tokens"],
+            "total_tokens": response["usage"]["total_tokens"],
+        }
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                tools: Optional[list] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        # Streamed text is passed through as is; tool calls are only parsed by invoke()
+        with self._lock():
+            for part in self._completion(messages, stop, tools, stream=True):
+                text = part["choices"][0]["delta"].get("content")
+                if text:
+                    chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
+                    if run_manager:
+                        run_manager.on_llm_new_token(text, chunk=chunk)
+                    yield chunk
+
+def benchmark(models: dict, prompts: list, runs: int = 3) -> dict:
+    """
+    Time-to-first-token and generation speed of chat models on the same prompts.
+
+    Args:
+        models (dict): Name -> chat model (anything with stream())
+        prompts (list): Prompts to send, as message lists or strings
+        runs (int): Times each prompt is sent to each model
+
+    Returns:
+        dict: Name -> mean ttft_ms, mean tokens_per_s and mean total_s
+    """
+    from tool_selector import count_tokens
+
+    results = {}
+    for name, model in models.items():
+        ttfts, speeds, totals = [], [], []
+        for _ in range(runs):
+            for prompt in prompts:
+                start_time = time.perf_counter()
+                first_token_at = None
+                text = ""
+                for chunk in model.stream(prompt):
+                    if chunk.content and first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    text += chunk.content
+                end_time = time.perf_counter()
+                if first_token_at is None:
+                    continue
+                ttfts.append(first_token_at - start_time)
+                totals.append(end_time - start_time)
+                generation_time = end_time - first_token_at
+                if generation_time > 0:
+                    speeds.append(count_tokens(text) / generation_time)
+        results[name] = {
+            "ttft_ms": round(sum(ttfts) / len(ttfts) * 1000, 1) if ttfts else None,
+            "tokens_per_s": round(sum(speeds) / len(speeds), 1) if speeds else None,
+            "total_s": round(sum(totals) / len(totals), 2) if totals else None,
+        }
+        print(name, results[name])
+    return results
+
+BENCHMARK_PROMPTS = [
+    [SystemMessage(content="You are a friendly assistant called Marty. Try and cheer them up. Use sentences that are less than 10 words."),
+     HumanMessage(content="I had a bad day at school.")],
+    [SystemMessage(content="You are a story telling robot called Marty. Keep the story short and concise."),
+     HumanMessage(content="Please tell a story that matches the genre: Adventure. Use short sentences no more than 7 words.")],
+]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the local LLM against the remote one")
+    parser.add_argument("--model", default=LOCAL_LLM_PATH, help="Path to the GGUF weights")
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads for llama.cpp")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--no-remote", action="store_true", help="Only benchmark the local model")
+    args = parser.parse_args()
+
+    models = {"local": LocalChatModel(model_path=args.model, n_threads=args.threads)}
+    if not args.no_remote:
+        from http_clients import get_chat_model
+        models["remote"] = get_chat_model("gpt-4o-mini", temperature=0)
+    benchmark(models, BENCHMARK_PROMPTS, args.runs)
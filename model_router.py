@@ -0,0 +1,223 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from http_clients import get_chat_model, resilient
+
+class ProviderStats:
+    """Rolling latency and error rate of one provider over its last few calls"""
+
+    def __init__(self, window: int = 20):
+        self.window = window
+        self.calls = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.probing = False
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.calls.append((latency, ok))
+        self.consecutive_failures = 0 if ok else self.consecutive_failures + 1
+
+    def mean_latency(self) -> float:
+        latencies = [latency for latency, ok in self.calls if ok]
+        return sum(latencies) / len(latencies) if latencies else 0.0
+
+    def error_rate(self) -> float:
+        if not self.calls:
+            return 0.0
+        return sum(1 for _, ok in self.calls if not ok) / len(self.calls)
+
+    def score(self) -> float:
+        """Expected cost of sending a request here: latency, inflated by recent errors (infinite if every call failed)"""
+        if self.calls and not any(ok for _, ok in self.calls):
+            return float("inf")
+        return self.mean_latency() * (1 + 2 * self.error_rate())
+
+    def reset(self) -> None:
+        self.calls.clear()
+        self.consecutive_failures = 0
+
+class ModelRouter:
+    """
+    Sends each LLM request to the currently fastest healthy provider.
+
+    Every provider keeps a rolling window of latencies and errors. A provider that
+    fails max_consecutive_failures times in a row, or whose error rate goes above
+    max_error_rate, is skipped for cooldown seconds. After that it gets a fresh window
+    and one probe request; if the probe fails it goes straight back into cooldown.
+    If the chosen provider fails, the request fails over to the next one in the same
+    call, so a session keeps going when one backend goes down.
+    A small share of requests (explore_rate) goes to another healthy provider so
+    latency estimates of the others stay current; providers that have not been
+    measured yet are ranked after the measured ones and explored first.
+    """
+
+    def __init__(self, providers: dict, window: int = 20, max_error_rate: float = 0.5, max_consecutive_failures: int = 3,
+                 cooldown: float = 30.0, explore_rate: float = 0.05, local_providers: tuple = ("local",)):
+        """
+        Args:
+            providers (dict): Provider name -> chat model (anything with bind_tools and invoke)
+            window (int): Number of recent calls used for each provider's statistics
+            max_error_rate (float): Error rate above which a provider is taken out of rotation
+            max_consecutive_failures (int): Failures in a row after which a provider is taken out of rotation
+            cooldown (float): Seconds an unhealthy provider stays out of rotation
+            explore_rate (float): Fraction of requests sent to a random healthy provider
+            local_providers (tuple): Providers running in this process, which are called directly:
+                retrying or abandoning a call would only queue more work behind the same model
+        """
+        if not providers:
+            raise ValueError("ModelRouter needs at least one provider")
+        self.providers = providers
+        self.stats = {name: ProviderStats(window) for name in providers}
+        self.max_error_rate = max_error_rate
+        self.max_consecutive_failures = max_consecutive_failures
+        self.cooldown = cooldown
+        self.explore_rate = explore_rate
+        self.local_providers = set(local_providers)
+        self.lock = threading.Lock()
+        self.decisions = {name: 0 for name in providers}
+        self.failovers = 0
+
+    def is_healthy(self, name: str) -> bool:
+        stats = self.stats[name]
+        if stats.cooldown_until:
+            if time.monotonic() < stats.cooldown_until:
+                return False
+            # Cooldown over: start over with a clean window and probe the provider
+            stats.cooldown_until = 0.0
+            stats.reset()
+            stats.probing = True
+        return True
+
+    def ranking(self) -> list:
+        """Provider names in the order they should be tried"""
+        with self.lock:
+            healthy = [name for name in self.providers if self.is_healthy(name)]
+            unhealthy = [name for name in self.providers if name not in healthy]
+            healthy.sort(key=self._rank_key)
+            if len(healthy) > 1 and random.random() < self.explore_rate:
+                unmeasured = [index for index in range(1, len(healthy)) if not self.stats[healthy[index]].calls]
+                index = unmeasured[0] if unmeasured else random.randrange(1, len(healthy))
+                healthy.insert(0, healthy.pop(index))
+            return healthy + unhealthy
+
+    def _rank_key(self, name: str) -> tuple:
+        """Measured providers by score, then unmeasured ones, then those whose calls all failed"""
+        stats = self.stats[name]
+        if not stats.calls:
+            return (1, 0.0)
+        score = stats.score()
+        return (2, 0.0) if score == float("inf") else (0, score)
+
+    def _record(self, name: str, latency: float, ok: bool) -> None:
+        with self.lock:
+            stats = self.stats[name]
+            stats.record(latency, ok)
+            if ok:
+                stats.probing = False
+            elif (stats.probing
+                  or stats.consecutive_failures >= self.max_consecutive_failures
+                  or (len(stats.calls) >= 5 and stats.error_rate() > self.max_error_rate)):
+                stats.cooldown_until = time.monotonic() + self.cooldown
+                stats.probing = False
+
+    def invoke_with(self, runnables: dict, value) -> AIMessage:
+        """Invoke the best provider's runnable, failing over to the others on errors"""
+        last_error = None
+        for attempt, name in enumerate(self.ranking()):
+            start_time = time.perf_counter()
+            try:
+                result = runnables[name].invoke(value)
+            except Exception as e:
+                self._record(name, time.perf_counter() - start_time, False)
+                print(f"LLM provider {name} failed: {e}")
+                last_error = e
+                continue
+            self._record(name, time.perf_counter() - start_time, True)
+            with self.lock:
+                self.decisions[name] += 1
+                if attempt:
+                    self.failovers += 1
+            return result
+        raise last_error
+
+    def bind_tools(self, tools: list, deadline: float = 10.0):
+        """Return a runnable that routes each call to a provider model with the tools bound"""
+        runnables = {}
+        for name, model in self.providers.items():
+            runnable = model.bind_tools(tools) if tools else model
+            runnables[name] = runnable if name in self.local_providers else resilient(runnable, deadline=deadline, max_attempts=2)
+        return RunnableLambda(lambda value: self.invoke_with(runnables, value), name="model_router")
+
+    def metrics(self) -> dict:
+        """Routing decisions and rolling statistics of every provider"""
+        with self.lock:
+            return {
+                "failovers": self.failovers,
+                "providers": {
+                    name: {
+                        "requests": self.decisions[name],
+                        "mean_latency_ms": round(self.stats[name].mean_latency() * 1000, 1),
+                        "error_rate": round(self.stats[name].error_rate(), 3),
+                        "cooling_down": self.stats[name].cooldown_until > time.monotonic(),
+                    }
+                    for name in self.providers
+                },
+            }
+
+def default_providers() -> dict:
+    """
+    Build the chat models to route between.
+
+    OpenAI is always available; Groq is added when GROQ_API_KEY is set, and the
+    offline llama.cpp model (local_llm.py) when its weights exist at LOCAL_LLM_PATH.
+    Set MARTY_LLM_PROVIDERS (e.g. "groq,openai", or "local" to run fully offline)
+    to choose which providers are used.
+    """
+    providers = {"openai": get_chat_model("gpt-4o-mini", temperature=0)}
+    if os.getenv("GROQ_API_KEY"):
+        from langchain_groq import ChatGroq
+        providers["groq"] = ChatGroq(model="llama-3.1-8b-instant", temperature=0, timeout=10, max_retries=0)
+    from local_llm import LOCAL_LLM_PATH
+    if os.path.exists(LOCAL_LLM_PATH):
+        from local_llm import LocalChatModel
+        providers["local"] = LocalChatModel(model_path=LOCAL_LLM_PATH)
+
+    selected = os.getenv("MARTY_LLM_PROVIDERS")
+    if selected:
+        providers = {name: providers[name] for name in selected.split(",") if name in providers}
+    return providers
+
+
+class FakeProvider:
+    """Chat model stand-in with configurable latency and error rate, for trying the router offline"""
+
+    def __init__(self, name: str, latency: float = 0.1, error_rate: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self.error_rate = error_rate
+
+    def bind_tools(self, tools):
+        return self
+
+    def invoke(self, value, *args, **kwargs) -> AIMessage:
+        time.sleep(self.latency * random.uniform(0.8, 1.2))
+        if random.random() < self.error_rate:
+            raise ConnectionError(f"{self.name} is unavailable")
+        return AIMessage(content=f"Answer from {self.name}")
+
+if __name__ == "__main__":
+    fast = FakeProvider("fast", latency=0.05)
+    slow = FakeProvider("slow", latency=0.2)
+    router = ModelRouter({"slow": slow, "fast": fast}, cooldown=1.0)
+    chain = router.bind_tools([])
+    for i in range(60):
+        # Halfway through, the fast provider goes down
+        fast.error_rate = 1.0 if 20 <= i < 40 else 0.0
+        chain.invoke("hello")
+    print(router.metrics())
@@ -0,0 +1,361 @@
+import argparse
+import random
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.messages import AIMessage
+
+from func_def import (
+    ROBOT_TOOLS, ASSISTANT_SYSTEM_PROMPT, STORYTELLER_SYSTEM_PROMPT, STORYTELLER_USER_PROMPT, COLOR_TO_EMOTION,
+)
+from transcriber import get_model
+from tts import TTSCache
+from speech_timing import SpeechTimer
+from http_clients import get_chat_model, resilient
+
+def tell_color_story(session, args) -> None:
+    """Pick a story genre from the color card under Marty's foot, tell the story and celebrate"""
+    session.marty.get_ready()
+    session.marty.walk(5, "auto", 0, 25, 1500, True)
+    session.marty.get_ready()
+    detected_color = session.marty.get_color_sensor_color("left")
+    print(f"[{session.name}] DETECTED COLOR", detected_color)
+    story = session.resources.storyteller.invoke({"emotion": COLOR_TO_EMOTION.get(detected_color, "neutral")})
+    session.speak(story.content)
+    session.marty.celebrate(4000, True)
+    session.break_loop = True
+
+# Tool name -> function running it on a session's robot; arguments and descriptions come from func_def.ROBOT_TOOLS
+ROBOT_ACTIONS = {
+    "walk": lambda s, a: s.marty.walk(a.num_steps, a.start_foot, a.turn, a.step_length, a.move_time, True),
+    "get_ready": lambda s, a: s.marty.get_ready(),
+    "select_color_and_tell_story": tell_color_story,
+    "exit_program": lambda s, a: setattr(s, "break_loop", True),
+    "dance": lambda s, a: s.marty.dance(a.side, a.move_time, True),
+    "kick": lambda s, a: s.marty.kick(a.side, a.twist, a.move_time, True),
+    "lean": lambda s, a: s.marty.lean(a.direction, a.amount, a.move_time, True),
+    "eyes": lambda s, a: s.marty.eyes(a.pose_or_angle, a.move_time, True),
+    "circle_dance": lambda s, a: s.marty.circle_dance(a.side, a.move_time, True),
+    "disco_color": lambda s, a: s.marty.disco_color(a.color, add_on=a.add_on, region=a.region),
+    "wiggle": lambda s, a: s.marty.wiggle(a.move_time, True),
+    "celebrate": lambda s, a: s.marty.celebrate(a.move_time, True),
+    "wave": lambda s, a: s.marty.wave(a.side),
+    "arms": lambda s, a: s.marty.arms(a.left_angle, a.right_angle, a.move_time, True),
+    "move_joint": lambda s, a: s.marty.move_joint(a.joint_name_or_num, a.position, a.move_time, True),
+    "sidestep": lambda s, a: s.marty.sidestep(a.side, a.steps, a.step_length, a.move_time, True),
+}
+
+def robot_tool_specs() -> list:
+    """OpenAI function specs for ROBOT_TOOLS, for bind_tools"""
+    return [
+        {"type": "function", "function": {"name": name, "description": description, "parameters": model.model_json_schema()}}
+        for name, (model, description) in ROBOT_TOOLS.items()
+    ]
+
+def build_assistant_chain(chat_model):
+    """Build the friendly assistant chain shared by all sessions"""
+    template = ChatPromptTemplate.from_messages([
+        ("system", ASSISTANT_SYSTEM_PROMPT),
+        MessagesPlaceholder(variable_name="chat_history"),
+        ("user", "{question}"),
+    ])
+    return template | resilient(chat_model.bind_tools(robot_tool_specs()))
+
+def build_storyteller_chain(chat_model):
+    """Build the storyteller chain shared by all sessions; the story is plain text, so no tools are sent"""
+    template = ChatPromptTemplate.from_messages([
+        ("system", STORYTELLER_SYSTEM_PROMPT),
+        ("user", STORYTELLER_USER_PROMPT),
+    ])
+    return template | resilient(chat_model)
+
+
+class FairASRScheduler:
+    """
+    Runs transcription jobs from many sessions on a small pool of worker threads.
+
+    Sessions are served round-robin, one job at a time, so a chatty session cannot
+    starve the others while the shared model is busy.
+    """
+
+    def __init__(self, transcribe, workers: int = 1):
+        """
+        Args:
+            transcribe: Callable taking an audio file path and returning its text
+            workers (int): Number of worker threads sharing the model
+        """
+        self.transcribe = transcribe
+        self.queues = {}
+        self.ready = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.served = {}
+        self.threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, session_name: str, audio_file_path: str) -> Future:
+        future = Future()
+        with self.condition:
+            queue = self.queues.setdefault(session_name, deque())
+            if not queue:
+                self.ready.append(session_name)
+            queue.append((audio_file_path, future))
+            self.condition.notify()
+        return future
+
+    def queue_depth(self) -> int:
+        with self.condition:
+            return sum(len(queue) for queue in self.queues.values())
+
+    def close(self) -> None:
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def _worker(self) -> None:
+        while True:
+            with self.condition:
+                while not self.ready and not self.closed:
+                    self.condition.wait()
+                if self.closed and not self.ready:
+                    return
+                session_name = self.ready.popleft()
+                queue = self.queues[session_name]
+                audio_file_path, future = queue.popleft()
+                # Go to the back of the line if this session still has work queued
+                if queue:
+                    self.ready.append(session_name)
+                self.served[session_name] = self.served.get(session_name, 0) + 1
+
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.transcribe(audio_file_path))
+            except Exception as e:
+                future.set_exception(e)
+
+
+class SessionMetrics:
+    """Per-stage latency samples of one session, in milliseconds"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, name: str, elapsed_ms: float) -> None:
+        self.samples.setdefault(name, []).append(elapsed_ms)
+
+    def summary(self) -> dict:
+        result = {}
+        for name, values in self.samples.items():
+            ordered = sorted(values)
+            result[name] = {
+                "count": len(values),
+                "p50": round(statistics.median(ordered), 1),
+                "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+            }
+        return result
+
+
+class SharedResources:
+    """Models and clients shared by every robot session in the process"""
+
+    def __init__(self, asr_model: str = "base", chat_model=None, tts_cache: TTSCache = None, asr_workers: int = 1,
+                 transcribe=None, assistant=None, storyteller=None):
+        """
+        Args:
+            asr_model (str): Whisper model loaded once for all sessions
+            chat_model: Chat model for the assistant and storyteller (default: gpt-4o-mini)
+            tts_cache (TTSCache): Cache of synthesized speech shared by all sessions
+            asr_workers (int): Number of threads running transcriptions
+            transcribe: Optional callable replacing Whisper (audio file path -> text)
+            assistant: Optional runnable replacing the assistant chain
+            storyteller: Optional runnable replacing the storyteller chain
+        """
+        self.tts_cache = tts_cache or TTSCache()
+        if not (assistant and storyteller):
+            chat_model = chat_model or get_chat_model("gpt-4o-mini", temperature=0)
+        self.assistant = assistant or build_assistant_chain(chat_model)
+        self.storyteller = storyteller or build_storyteller_chain(chat_model)
+        transcribe = transcribe or (lambda path: get_model(asr_model).transcribe(path)["text"])
+        self.asr = FairASRScheduler(transcribe, asr_workers)
+
+
+class RobotSession:
+    """State of one robot conversation: its robot, chat history and metrics"""
+
+    def __init__(self, name: str, marty, listen, resources: SharedResources, speak=None):
+        """
+        Args:
+            name (str): Session name used in logs and metrics
+            marty: Marty instance (or SimulatedMarty) for this session
+            listen: Callable returning the path of the next recorded utterance, or None if nothing was heard
+            resources (SharedResources): Shared models and clients
+            speak: Optional callable used instead of speaking through the robot
+        """
+        self.name = name
+        self.marty = marty
+        self.listen = listen
+        self.resources = resources
+        self.messages = []
+        self.break_loop = False
+        self.turns = 0
+        self.metrics = SessionMetrics()
+        self.speech_timer = SpeechTimer(marty, tts_cache=resources.tts_cache) if speak is None else None
+        self.speak = speak or (lambda text: self.speech_timer.say(text, wait=True))
+
+
+class Orchestrator:
+    """Runs several robot sessions in one process on shared ASR, LLM and TTS resources"""
+
+    def __init__(self, resources: SharedResources, idle_interval: float = 0.1):
+        """
+        Args:
+            resources (SharedResources): Shared models and clients
+            idle_interval (float): Seconds a session waits before listening again when nothing was heard
+        """
+        self.resources = resources
+        self.idle_interval = idle_interval
+        self.sessions = []
+
+    def add_session(self, name: str, marty, listen, speak=None) -> RobotSession:
+        session = RobotSession(name, marty, listen, self.resources, speak)
+        self.sessions.append(session)
+        return session
+
+    def run_turn(self, session: RobotSession) -> bool:
+        """Handle one conversation cycle of a session, returning False if nothing was heard"""
+        turn_start = time.perf_counter()
+        audio_file_path = session.listen()
+        if audio_file_path is None:
+            return False
+        session.turns += 1
+
+        start_time = time.perf_counter()
+        transcription = self.resources.asr.submit(session.name, audio_file_path).result()
+        session.metrics.add("asr", (time.perf_counter() - start_time) * 1000)
+        if not transcription.strip():
+            return True
+
+        if len(session.messages) > 12:
+            session.messages = session.messages[-6:]
+        start_time = time.perf_counter()
+        result = self.resources.assistant.invoke({"question": transcription, "chat_history": session.messages})
+        session.metrics.add("assistant", (time.perf_counter() - start_time) * 1000)
+
+        start_time = time.perf_counter()
+        if result.tool_calls:
+            for tool_call in result.tool_calls:
+                self.dispatch_tool(session, tool_call)
+            session.metrics.add("tools", (time.perf_counter() - start_time) * 1000)
+        else:
+            session.messages.append(result)
+            session.speak(result.content)
+            session.metrics.add("speak", (time.perf_counter() - start_time) * 1000)
+        session.metrics.add("turn", (time.perf_counter() - turn_start) * 1000)
+        return True
+
+    def dispatch_tool(self, session: RobotSession, tool_call: dict) -> None:
+        if tool_call["name"] not in ROBOT_TOOLS:
+            print(f"[{session.name}] Unknown tool {tool_call['name']}")
+            return
+        model, _ = ROBOT_TOOLS[tool_call["name"]]
+        print(f"[{session.name}] EXECUTING {tool_call['name'].upper()}", tool_call["args"])
+        ROBOT_ACTIONS[tool_call["name"]](session, model.model_validate(tool_call["args"]))
+
+    def _session_loop(self, session: RobotSession, max_turns: int) -> None:
+        while not session.break_loop and (max_turns is None or session.turns < max_turns):
+            try:
+                heard = self.run_turn(session)
+            except Exception as e:
+                print(f"[{session.name}] Error in conversation flow: {e}")
+                heard = False
+            if not heard:
+                # Don't spin on a listen() that returns immediately with nothing
+                time.sleep(self.idle_interval)
+
+    def run(self, max_turns: int = None) -> dict:
+        """Run every session in its own thread until they exit, and return their metrics"""
+        threads = [threading.Thread(target=self._session_loop, args=(session, max_turns), name=session.name)
+                   for session in self.sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report()
+
+    def report(self) -> dict:
+        return {
+            session.name: {
+                "turns": session.turns,
+                "asr_jobs": self.resources.asr.served.get(session.name, 0),
+                "latency_ms": session.metrics.summary(),
+            }
+            for session in self.sessions
+        }
+
+
+class SimulatedMarty:
+    """Marty stand-in that records commands and takes roughly as long as the real motion"""
+
+    def __init__(self, name: str, time_scale: float = 0.01):
+        self.name = name
+        self.time_scale = time_scale
+        self.commands = []
+
+    def __getattr__(self, method):
+        if method.startswith("__"):
+            raise AttributeError(method)
+        def command(*args, **kwargs):
+            self.commands.append((method, args))
+            move_time = max([a for a in args if isinstance(a, int)] or [1000])
+            time.sleep(move_time / 1000 * self.time_scale)
+            return True
+        return command
+
+class SimulatedAssistant:
+    """Assistant stand-in that replies after a random delay, sometimes with a tool call"""
+
+    def __init__(self, delay: float = 0.2, tool_rate: float = 0.3):
+        self.delay = delay
+        self.tool_rate = tool_rate
+
+    def invoke(self, inputs, *args, **kwargs) -> AIMessage:
+        time.sleep(random.uniform(0.5, 1.5) * self.delay)
+        if random.random() < self.tool_rate:
+            return AIMessage(content="", tool_calls=[{"name": "dance", "args": {}, "id": "sim"}])
+        return AIMessage(content=f"You said: {inputs.get('question', '')}")
+
+def simulate(num_sessions: int = 4, turns: int = 5, asr_delay: float = 0.3, llm_delay: float = 0.5) -> dict:
+    """Run simulated robots through the orchestrator without hardware, models or network access"""
+    def fake_transcribe(audio_file_path):
+        time.sleep(asr_delay)
+        return f"hello from {audio_file_path}"
+
+    resources = SharedResources(transcribe=fake_transcribe, assistant=SimulatedAssistant(llm_delay),
+                                storyteller=SimulatedAssistant(llm_delay, tool_rate=0))
+
+    orchestrator = Orchestrator(resources)
+    for i in range(num_sessions):
+        name = f"marty-{i}"
+        orchestrator.add_session(
+            name,
+            SimulatedMarty(name),
+            listen=lambda name=name: f"{name}.mp3",
+            speak=lambda text: time.sleep(0.01 * len(text.split())),
+        )
+    report = orchestrator.run(max_turns=turns)
+    resources.asr.close()
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run simulated Marty sessions through the orchestrator")
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=5)
+    args = parser.parse_args()
+    for name, stats in simulate(args.sessions, args.turns).items():
+        print(name, stats)
@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import re
+
+from tts import TTSCache
+from speech_timing import clip_duration
+
+# Phrases Marty says often enough to keep on the robot
+DEFAULT_PHRASES = {
+    "greeting": "Hello dear! I'm Marty, your robot friend. I'm ready to chat with you! how are you feeling today?",
+    "goodbye": "Goodbye! It was nice talking to you! See you soon!",
+    "repeat": "I'm sorry, I didn't catch that. Can you please repeat?",
+    "thinking": "Hmm, let me think.",
+    "one_moment": "One moment please.",
+    "story_intro": "Let me tell you a story!",
+    "the_end": "The end! Did you enjoy that story?",
+    "oops": "Oops, my head got a bit muddled. Can you say that again?",
+}
+
+def load_phrases(path: str = "phrases.json") -> dict:
+    """Return the phrase bank configuration: DEFAULT_PHRASES updated with a JSON file of name -> text, if present"""
+    phrases = dict(DEFAULT_PHRASES)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            phrases.update(json.load(f))
+    return phrases
+
+def normalize(text: str) -> str:
+    """Lowercase and strip punctuation so small formatting differences still match a phrase"""
+    return " ".join(re.sub(r"[^a-z0-9' ]", " ", text.lower()).split())
+
+def file_checksum(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+class PhraseBank:
+    """
+    Frequent phrases synthesized once, stored on Marty and played by name.
+
+    prepare() synthesizes every configured phrase (through the shared TTS cache) and
+    uploads it to the robot's file system. A manifest of uploaded checksums per robot
+    is kept locally, so files that have not changed are not sent again. Playing a
+    phrase then only costs a short play command instead of an audio transfer.
+    Robots without file upload support fall back to streaming the cached clip.
+
+    The manifest is checked against the robot's file list when the robot can report
+    one. A phrase that fails to play from the robot (e.g. after its storage was
+    wiped) is streamed instead and dropped from the manifest, so it is uploaded
+    again by the next prepare().
+    """
+
+    def __init__(self, marty, phrases: dict = None, speech_timer=None, tts_cache: TTSCache = None, voice: str = "alloy",
+                 robot_id: str = "marty", manifest_path: str = "phrase_bank_manifest.json"):
+        """
+        Args:
+            marty: Connected Marty instance
+            phrases (dict): Phrase name -> text (default: load_phrases())
+            speech_timer: Optional SpeechTimer so phrases are timed with the rest of Marty's speech
+            tts_cache (TTSCache): Cache used to synthesize the phrases
+            voice (str): TTS voice of the phrases
+            robot_id (str): Identifies the robot in the manifest (e.g. its IP address)
+            manifest_path (str): JSON file recording what has been uploaded to each robot
+        """
+        self.marty = marty
+        self.phrases = phrases if phrases is not None else load_phrases()
+        self.speech_timer = speech_timer
+        self.tts_cache = tts_cache or TTSCache()
+        self.voice = voice
+        self.robot_id = robot_id
+        self.manifest_path = manifest_path
+        self.by_text = {normalize(text): name for name, text in self.phrases.items()}
+        self.clips = {}
+        self.durations = {}
+        self.on_robot = set()
+        self.stats = {"uploaded": 0, "unchanged": 0, "missing_on_robot": 0, "played_on_robot": 0, "streamed": 0}
+
+    def remote_name(self, name: str) -> str:
+        return f"pb_{name}.mp3"
+
+    def _load_manifest(self) -> dict:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest: dict) -> None:
+        with open(self.manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+    def _robot_files(self):
+        """Names of the files stored on the robot, or None if it cannot list them"""
+        get_file_list = getattr(self.marty, "get_file_list", None)
+        if get_file_list is None:
+            return None
+        try:
+            return {os.path.basename(str(entry.get("name", "") if isinstance(entry, dict) else entry))
+                    for entry in get_file_list()}
+        except Exception as e:
+            print(f"Could not list the files on the robot: {e}")
+            return None
+
+    def _forget(self, name: str) -> None:
+        """Stop playing a phrase from the robot and drop it from the manifest so it is uploaded again"""
+        self.on_robot.discard(name)
+        self.stats["missing_on_robot"] += 1
+        manifest = self._load_manifest()
+        if manifest.get(self.robot_id, {}).pop(self.remote_name(name), None) is not None:
+            self._save_manifest(manifest)
+
+    def prepare(self) -> dict:
+        """Synthesize all phrases and upload the ones the robot does not have yet"""
+        manifest = self._load_manifest()
+        uploaded = manifest.setdefault(self.robot_id, {})
+        can_upload = hasattr(self.marty, "send_file")
+        robot_files = self._robot_files() if can_upload else None
+
+        for name, text in self.phrases.items():
+            clip_file = self.tts_cache.get(text, self.voice)
+            self.clips[name] = clip_file
+            self.durations[name] = clip_duration(clip_file)
+            if not can_upload:
+                continue
+
+            checksum = file_checksum(clip_file)
+            remote_name = self.remote_name(name)
+            if robot_files is not None and remote_name not in robot_files and remote_name in uploaded:
+                # The manifest says it was uploaded but the robot no longer has it
+                self.stats["missing_on_robot"] += 1
+                del uploaded[remote_name]
+            if uploaded.get(remote_name) == checksum:
+                self.stats["unchanged"] += 1
+                self.on_robot.add(name)
+                continue
+            try:
+                # The robot stores the file under the name of the local file, so upload a copy named remote_name
+                upload_path = os.path.join(os.path.dirname(clip_file), remote_name)
+                with open(clip_file, "rb") as src, open(upload_path, "wb") as dst:
+                    dst.write(src.read())
+                ok = self.marty.send_file(upload_path)
+                os.remove(upload_path)
+            except Exception as e:
+                print(f"Could not upload phrase {name}: {e}")
+                ok = False
+            if ok is not False:
+                uploaded[remote_name] = checksum
+                self.on_robot.add(name)
+                self.stats["uploaded"] += 1
+
+        self._save_manifest(manifest)
+        print(f"Phrase bank ready: {len(self.on_robot)}/{len(self.phrases)} phrases on the robot", self.stats)
+        return self.stats
+
+    def lookup(self, text: str):
+        """Return the name of the phrase matching the text, or None"""
+        return self.by_text.get(normalize(text))
+
+    def play(self, name: str, wait: bool = True) -> None:
+        """Play a phrase by name, from the robot's storage when it has been uploaded"""
+        if name not in self.clips:
+            raise KeyError(f"Unknown phrase: {name}")
+        if name in self.on_robot:
+            send = lambda: self._play_on_robot(name)
+            self.stats["played_on_robot"] += 1
+        else:
+            send = lambda: self._stream(name)
+            self.stats["streamed"] += 1
+
+        if self.speech_timer is not None:
+            self.speech_timer.play_command(send, self.durations[name], wait)
+        else:
+            send()
+
+    def _play_on_robot(self, name: str) -> None:
+        try:
+            ok = self.marty.play_sound(self.remote_name(name))
+        except Exception as e:
+            print(f"Could not play phrase {name} from the robot: {e}")
+            ok = False
+        if ok is False:
+            self._forget(name)
+            self.stats["streamed"] += 1
+            self._stream(name)
+
+    def _stream(self, name: str) -> None:
+        # martypy's play_mp3 returns only once the whole clip has been streamed
+        if self.speech_timer is not None:
+            self.speech_timer.stream(self.clips[name])
+        else:
+            self.marty.play_mp3(self.clips[name])
+
+    def play_text(self, text: str, wait: bool = True) -> bool:
+        """Play the text from the bank if it is a known phrase. Returns False if it is not"""
+        name = self.lookup(text)
+        if name is None or name not in self.clips:
+            return False
+        self.play(name, wait)
+        return True
@@ -0,0 +1,194 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+def current_rss_mb() -> float:
+    """Resident memory of this process in MB (peak RSS where the current value is not available, 0 on Windows)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        # Windows has neither /proc nor the resource module
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+class StageProfiler:
+    """
+    CPU and memory profiler for the stages of a conversation turn.
+
+    Used as a stage hook in agent.py. On sampled turns every stage runs under
+    cProfile and tracemalloc snapshots are taken before and after it, so CPU time
+    and new allocations can be attributed to record_audio, transcribe_audio, the
+    assistant call and speak_text. RSS and traced memory are recorded after every
+    turn to show growth over a long session.
+
+    cProfile only sees the thread it was enabled in, so work a stage hands to
+    another thread (the assistant call runs in the latency budget's executor) is
+    profiled by wrapping it with profile_call(). The CPU time of a stage is the
+    process CPU time spent while it ran, which covers every thread.
+    """
+
+    def __init__(self, report_dir: str = "profiles", sample_every: int = 1, top: int = 15, frames: int = 10):
+        """
+        Args:
+            report_dir (str): Directory the session report is written to
+            sample_every (int): Profile every Nth turn (snapshots are slow with large models loaded)
+            top (int): Number of functions and allocation sites to keep per stage
+            frames (int): Stack depth stored by tracemalloc for each allocation
+        """
+        self.report_dir = report_dir
+        self.sample_every = max(1, sample_every)
+        self.top = top
+        self.turn = 0
+        self.sampled = False
+        self.active_stage = None
+        self.profiles = {}
+        self.cpu_seconds = {}
+        self.allocations = {}
+        self.stage_memory = {}
+        self.turns = []
+        self.started_at = time.strftime("%Y%m%d-%H%M%S")
+        tracemalloc.start(frames)
+        self.baseline_rss = current_rss_mb()
+
+    def begin_turn(self) -> None:
+        self.turn += 1
+        self.sampled = (self.turn - 1) % self.sample_every == 0
+
+    def end_turn(self) -> None:
+        traced, peak = tracemalloc.get_traced_memory()
+        rss = current_rss_mb()
+        previous = self.turns[-1]["rss_mb"] if self.turns else self.baseline_rss
+        self.turns.append({
+            "turn": self.turn,
+            "rss_mb": round(rss, 1),
+            "rss_growth_mb": round(rss - previous, 1),
+            "traced_mb": round(traced / 1024 ** 2, 1),
+            "traced_peak_mb": round(peak / 1024 ** 2, 1),
+        })
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name: str):
+        # Nested stages are attributed to the outermost one
+        if not self.sampled or self.active_stage is not None:
+            yield
+            return
+
+        self.active_stage = name
+        before = self._snapshot()
+        traced_before = tracemalloc.get_traced_memory()[0]
+        profile = cProfile.Profile()
+        self.profiles.setdefault(name, []).append(profile)
+        cpu_start = time.process_time()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.cpu_seconds[name] = self.cpu_seconds.get(name, 0.0) + time.process_time() - cpu_start
+            traced_after = tracemalloc.get_traced_memory()[0]
+            after = self._snapshot()
+            self.active_stage = None
+            self._add_allocations(name, after.compare_to(before, "lineno"))
+            self.stage_memory.setdefault(name, []).append(round((traced_after - traced_before) / 1024, 1))
+
+    def profile_call(self, name: str, fn):
+        """Wrap fn so that, on sampled turns, it is profiled as part of the stage in whatever thread runs it"""
+        def profiled(*args, **kwargs):
+            if not self.sampled:
+                return fn(*args, **kwargs)
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Python 3.12+ profiles every thread from the stage's own profiler already
+                return fn(*args, **kwargs)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profile.disable()
+                self.profiles.setdefault(name, []).append(profile)
+        return profiled
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        """Take a tracemalloc snapshot without the profiler's own allocations"""
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+
+    def _add_allocations(self, name: str, differences: list) -> None:
+        totals = self.allocations.setdefault(name, {})
+        for stat in differences:
+            if stat.size_diff <= 0:
+                continue
+            frame = stat.traceback[0]
+            location = f"{frame.filename}:{frame.lineno}"
+            size, count = totals.get(location, (0, 0))
+            totals[location] = (size + stat.size_diff, count + stat.count_diff)
+
+    def _top_functions(self, name: str) -> list:
+        stats = pstats.Stats(*self.profiles[name])
+        rows = []
+        for (filename, lineno, function), (_, calls, own_time, cumulative, _) in stats.stats.items():
+            rows.append({
+                "function": f"{os.path.basename(filename)}:{lineno}({function})",
+                "calls": calls,
+                "own_s": round(own_time, 4),
+                "cumulative_s": round(cumulative, 4),
+            })
+        rows.sort(key=lambda row: row["cumulative_s"], reverse=True)
+        return rows[:self.top]
+
+    def report(self) -> dict:
+        stages = {}
+        for name in self.profiles:
+            allocations = sorted(self.allocations.get(name, {}).items(), key=lambda item: item[1][0], reverse=True)
+            stages[name] = {
+                "cpu_s": round(self.cpu_seconds.get(name, 0.0), 3),
+                "traced_growth_kb_per_turn": self.stage_memory.get(name, []),
+                "top_functions": self._top_functions(name),
+                "top_allocators": [
+                    {"location": location, "size_kb": round(size / 1024, 1), "blocks": count}
+                    for location, (size, count) in allocations[:self.top]
+                ],
+            }
+        return {
+            "turns_profiled": sum(1 for turn in range(1, self.turn + 1) if (turn - 1) % self.sample_every == 0),
+            "baseline_rss_mb": round(self.baseline_rss, 1),
+            "turns": self.turns,
+            "stages": stages,
+        }
+
+    def write_report(self) -> str:
+        """Write the session report as JSON plus a short text summary, and return the JSON path"""
+        os.makedirs(self.report_dir, exist_ok=True)
+        report = self.report()
+        json_path = os.path.join(self.report_dir, f"profile_{self.started_at}.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+        lines = [f"Baseline RSS: {report['baseline_rss_mb']} MB"]
+        for turn in report["turns"]:
+            lines.append(f"Turn {turn['turn']}: RSS {turn['rss_mb']} MB ({turn['rss_growth_mb']:+} MB), traced {turn['traced_mb']} MB")
+        for name, stage in report["stages"].items():
+            lines.append(f"\n[{name}] CPU {stage['cpu_s']} s, traced growth per turn (KB): {stage['traced_growth_kb_per_turn']}")
+            for allocation in stage["top_allocators"][:5]:
+                lines.append(f"  {allocation['size_kb']:>10} KB  {allocation['location']}")
+        with open(json_path[:-len(".json")] + ".txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        print(f"Profile written to {json_path}")
+        return json_path
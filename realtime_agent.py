@@ -0,0 +1,230 @@
+import base64
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+
+import numpy as np
+import sounddevice as sd
+from pydub import AudioSegment
+from websockets.sync.client import connect
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from speech_timing import SpeechTimer
+
+REALTIME_URL = os.getenv("REALTIME_URL", "wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01")
+# The realtime API sends and receives 16-bit mono PCM at 24 kHz
+SAMPLE_RATE = 24000
+REALTIME_INSTRUCTIONS = "You are a friendly robot called Marty talking to a child. Try and cheer them up. Use short sentences of less than 10 words. Use the tools provided to help them and follow their commands."
+
+def realtime_tool_specs(tools: list) -> list:
+    """Convert LangChain tools to the flat function format used by the realtime API"""
+    specs = []
+    for tool in tools:
+        function = convert_to_openai_tool(tool)["function"]
+        specs.append({"type": "function", **function})
+    return specs
+
+class MartyAudioPlayer:
+    """
+    Plays PCM chunks from the realtime API on Marty as they arrive.
+
+    Chunks are grouped into short segments (segment_ms), each encoded as an MP3 and
+    handed to a SpeechTimer, which starts every segment exactly when the previous
+    one ends. Playback of a reply starts as soon as the first segment is ready.
+    Pass the agent's SpeechTimer so speech from tools (e.g. the story) is queued
+    behind the reply instead of playing over it.
+    """
+
+    def __init__(self, marty, segment_ms: int = 400, bitrate: str = "64k", speech_timer: SpeechTimer = None):
+        self.speech_timer = speech_timer or SpeechTimer(marty, start_latency=0.0)
+        self.segment_bytes = int(SAMPLE_RATE * segment_ms / 1000) * 2
+        self.bitrate = bitrate
+        self.buffer = bytearray()
+        self.segments = queue.Queue()
+        self.generation = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def feed(self, pcm: bytes) -> None:
+        self.buffer.extend(pcm)
+        while len(self.buffer) >= self.segment_bytes:
+            self.segments.put((self.generation, bytes(self.buffer[:self.segment_bytes])))
+            del self.buffer[:self.segment_bytes]
+
+    def flush(self) -> None:
+        """Queue whatever is left of the current reply"""
+        if self.buffer:
+            self.segments.put((self.generation, bytes(self.buffer)))
+            self.buffer.clear()
+
+    def clear(self) -> None:
+        """Drop queued audio, e.g. when the user starts talking over Marty"""
+        self.generation += 1
+        self.buffer.clear()
+        while True:
+            try:
+                self.segments.get_nowait()
+            except queue.Empty:
+                break
+
+    def _run(self) -> None:
+        while True:
+            generation, pcm = self.segments.get()
+            # Wait for this segment's turn outside the timer's lock, so clear() can still drop it
+            delay = self.speech_timer.remaining() - self.speech_timer.start_latency
+            if delay > 0:
+                time.sleep(delay)
+            if generation != self.generation:
+                continue
+            fd, clip_file = tempfile.mkstemp(suffix=".mp3", prefix="marty_realtime_")
+            os.close(fd)
+            segment = AudioSegment(data=pcm, sample_width=2, frame_rate=SAMPLE_RATE, channels=1)
+            segment.export(clip_file, format="mp3", bitrate=self.bitrate)
+            self.speech_timer.play(clip_file, duration=len(segment) / 1000, delete_after=True)
+
+class RealtimeSession:
+    """
+    Speech-to-speech conversation with Marty over a single realtime WebSocket.
+
+    Microphone audio is streamed continuously; the server detects when the child
+    stops talking and streams back the spoken reply, which is played on Marty chunk
+    by chunk. Function calls are run with the same LangChain tools as the regular
+    agent and their results are sent back so the model can continue.
+    """
+
+    def __init__(self, tools: list, marty, url: str = REALTIME_URL, instructions: str = REALTIME_INSTRUCTIONS,
+                 voice: str = "alloy", should_stop=None, speech_timer: SpeechTimer = None, microphone: bool = True):
+        """
+        Args:
+            tools (list): LangChain tools the model may call
+            marty: Connected Marty instance used for playback
+            url (str): Realtime WebSocket URL (point it at a local mock server for testing)
+            instructions (str): System instructions for the session
+            voice (str): Voice of the spoken replies
+            should_stop: Optional callable; the session ends when it returns True
+            speech_timer (SpeechTimer): Timer shared with the tools' speech (a new one if not given)
+            microphone (bool): Stream the microphone (False to drive the session from a mock server)
+        """
+        self.tools_by_name = {tool.name: tool for tool in tools}
+        self.tool_specs = realtime_tool_specs(tools)
+        self.url = url
+        self.instructions = instructions
+        self.voice = voice
+        self.should_stop = should_stop or (lambda: False)
+        self.player = MartyAudioPlayer(marty, speech_timer=speech_timer)
+        self.microphone = microphone
+        self.outgoing = queue.Queue()
+        self.running = False
+        self.response_active = False
+        self.speech_stopped_at = None
+        self.first_audio_at = None
+        self.turn_latencies = []
+
+    def send(self, event: dict) -> None:
+        self.outgoing.put(json.dumps(event))
+
+    def _sender(self, ws) -> None:
+        while self.running:
+            try:
+                message = self.outgoing.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            ws.send(message)
+
+    def _microphone_callback(self, indata: np.ndarray, frames: int, time_info, status) -> None:
+        if status:
+            print(status)
+        self.send({"type": "input_audio_buffer.append", "audio": base64.b64encode(indata.tobytes()).decode("ascii")})
+
+    def _run_tool(self, event: dict) -> None:
+        name = event["name"]
+        try:
+            args = json.loads(event.get("arguments") or "{}")
+            print(f"EXECUTING {name.upper()}", args)
+            output = self.tools_by_name[name].invoke(args)
+        except Exception as e:
+            output = f"Error: {e}"
+        self.send({"type": "conversation.item.create",
+                   "item": {"type": "function_call_output", "call_id": event["call_id"], "output": str(output)}})
+        self.send({"type": "response.create"})
+
+    def interrupt(self) -> None:
+        """Cancel the reply being generated and drop the audio not yet played"""
+        if self.response_active:
+            self.send({"type": "response.cancel"})
+            self.response_active = False
+        self.player.clear()
+
+    def handle_event(self, event: dict) -> None:
+        event_type = event.get("type")
+        if event_type == "response.created":
+            self.response_active = True
+        elif event_type == "response.done":
+            self.response_active = False
+        elif event_type == "response.audio.delta":
+            if self.first_audio_at is None and self.speech_stopped_at is not None:
+                self.first_audio_at = time.perf_counter()
+                latency = self.first_audio_at - self.speech_stopped_at
+                self.turn_latencies.append(latency)
+                print(f"Turn latency: {latency * 1000:.0f} ms")
+            self.player.feed(base64.b64decode(event["delta"]))
+        elif event_type == "response.audio.done":
+            self.player.flush()
+        elif event_type == "response.audio_transcript.done":
+            print("Marty:", event.get("transcript"))
+        elif event_type == "conversation.item.input_audio_transcription.completed":
+            print("You said:", event.get("transcript"))
+        elif event_type == "input_audio_buffer.speech_started":
+            # The child is talking over Marty, stop the rest of the reply
+            self.interrupt()
+        elif event_type == "input_audio_buffer.speech_stopped":
+            self.speech_stopped_at = time.perf_counter()
+            self.first_audio_at = None
+        elif event_type == "response.function_call_arguments.done":
+            # Tools move the robot and block, so don't hold up the event loop
+            threading.Thread(target=self._run_tool, args=(event,), daemon=True).start()
+        elif event_type == "error":
+            print("Realtime error:", event.get("error"))
+
+    def run(self) -> None:
+        """Connect, stream the microphone and handle events until should_stop() or Ctrl+C"""
+        headers = {"Authorization": "Bearer " + os.getenv("OPENAI_API_KEY", ""), "OpenAI-Beta": "realtime=v1"}
+        with connect(self.url, additional_headers=headers, max_size=None) as ws:
+            print("Connected to realtime server.")
+            self.running = True
+            sender = threading.Thread(target=self._sender, args=(ws,), daemon=True)
+            sender.start()
+            self.send({
+                "type": "session.update",
+                "session": {
+                    "modalities": ["audio", "text"],
+                    "instructions": self.instructions,
+                    "voice": self.voice,
+                    "input_audio_format": "pcm16",
+                    "output_audio_format": "pcm16",
+                    "input_audio_transcription": {"model": "whisper-1"},
+                    "turn_detection": {"type": "server_vad"},
+                    "tools": self.tool_specs,
+                    "tool_choice": "auto",
+                },
+            })
+            try:
+                microphone = (sd.InputStream(samplerate=SAMPLE_RATE, channels=1, dtype=np.int16,
+                                             blocksize=SAMPLE_RATE // 50, callback=self._microphone_callback)
+                              if self.microphone else nullcontext())
+                with microphone:
+                    while not self.should_stop():
+                        try:
+                            message = ws.recv(timeout=0.5)
+                        except TimeoutError:
+                            continue
+                        self.handle_event(json.loads(message))
+            finally:
+                self.running = False
+                sender.join(timeout=1)
+        if self.turn_latencies:
+            print(f"Mean turn latency: {sum(self.turn_latencies) / len(self.turn_latencies) * 1000:.0f} ms")
@@ -0,0 +1,210 @@
+import threading
+import time
+
+# Marty methods that never move a joint; everything else is assumed to change the pose
+NON_MOTION_METHODS = {"play_mp3", "play_sound", "send_file", "speak", "close", "disco_color", "set_volume", "set_blocking"}
+# Commanded joint positions within this many degrees of the measured ones are kept on resync
+JOINT_TOLERANCE = 5
+# Marty V2 joint IDs, so move_joint(6, ...) and arms() track the same servo
+JOINT_NAMES = {0: "left hip", 1: "left twist", 2: "left knee", 3: "right hip", 4: "right twist",
+               5: "right knee", 6: "left arm", 7: "right arm", 8: "eyes"}
+
+def joint_key(joint_name_or_num) -> str:
+    """Name a joint is tracked under, whether it was given by ID or by name"""
+    if isinstance(joint_name_or_num, int) or str(joint_name_or_num).strip().isdigit():
+        return JOINT_NAMES.get(int(joint_name_or_num), str(joint_name_or_num).strip())
+    return str(joint_name_or_num).strip().lower()
+
+class TrackedMarty:
+    """
+    Wraps a Marty and skips commands that would not change anything.
+
+    The tracker mirrors what was last commanded: whether Marty is in the ready pose,
+    joint positions set with move_joint, arms or eyes, LED colors, volume and
+    blocking mode. A command that asks for the state Marty is already in returns
+    immediately instead of costing a round-trip (and servo settle time for
+    blocking moves). Any other motion (walk, dance, ...) forgets the pose.
+
+    The mirrored state is updated under a lock, but commands are sent after it is
+    released, so a blocking move in one thread never holds up the others.
+
+    Every resync_interval seconds the mirrored state is checked against the robot
+    in a background thread, so commands never wait for the read-backs: joint
+    positions are read back and kept only if they still match, and state that
+    cannot be read back (the ready pose, LEDs, volume, eye poses) is forgotten, so
+    a robot that was moved or reset by hand is never left out of sync for long.
+
+    All other attributes are passed through to the wrapped Marty.
+    """
+
+    def __init__(self, marty, resync_interval: float = 30.0):
+        """
+        Args:
+            marty: Connected Marty instance
+            resync_interval (float): Seconds between checks of the mirrored state against the robot
+        """
+        self.marty = marty
+        self.resync_interval = resync_interval
+        self.lock = threading.RLock()
+        self.ready = False
+        self.joints = {}
+        self.leds = {}
+        self.volume = None
+        self.blocking = None
+        self.last_resync = time.monotonic()
+        self.resyncing = False
+        self.stats = {"sent": 0, "elided": 0, "elided_by_command": {}, "resyncs": 0, "resync_mismatches": 0}
+
+    def _elide(self, command: str) -> bool:
+        self.stats["elided"] += 1
+        self.stats["elided_by_command"][command] = self.stats["elided_by_command"].get(command, 0) + 1
+        return True
+
+    def _send(self, forget, command: str, *args, **kwargs):
+        """
+        Send a command to the robot; called after releasing the lock, so a blocking
+        move does not hold up other commands. The state is recorded before sending,
+        and forget() drops it again if the command fails.
+        """
+        try:
+            return getattr(self.marty, command)(*args, **kwargs)
+        except Exception:
+            with self.lock:
+                forget()
+            raise
+
+    def _maybe_resync(self) -> None:
+        # Called with the lock held
+        if not self.resyncing and time.monotonic() - self.last_resync >= self.resync_interval:
+            self.resyncing = True
+            self.last_resync = time.monotonic()
+            threading.Thread(target=self.resync, daemon=True).start()
+
+    def resync(self) -> None:
+        """Check the mirrored state against the robot and forget whatever cannot be confirmed"""
+        with self.lock:
+            self.last_resync = time.monotonic()
+            self.stats["resyncs"] += 1
+            commanded = dict(self.joints)
+            self.ready = False
+            self.leds.clear()
+            self.volume = None
+        try:
+            # Read back without the lock, so commands sent meanwhile are not held up
+            measured = {}
+            for joint, position in commanded.items():
+                try:
+                    measured[joint] = self.marty.get_joint_position(joint) if isinstance(position, (int, float)) else None
+                except Exception:
+                    measured[joint] = None
+            with self.lock:
+                for joint, position in commanded.items():
+                    # A joint commanded again while reading back keeps its new position
+                    if self.joints.get(joint) != position:
+                        continue
+                    if measured[joint] is None or abs(measured[joint] - position) > JOINT_TOLERANCE:
+                        del self.joints[joint]
+                        self.stats["resync_mismatches"] += 1
+        finally:
+            with self.lock:
+                self.resyncing = False
+
+    def get_ready(self, *args, **kwargs):
+        with self.lock:
+            self._maybe_resync()
+            if self.ready:
+                return self._elide("get_ready")
+            self.stats["sent"] += 1
+            self.ready = True
+            # get_ready moves every joint, so earlier positions no longer hold
+            self.joints.clear()
+        return self._send(lambda: setattr(self, "ready", False), "get_ready", *args, **kwargs)
+
+    def move_joint(self, joint_name_or_num, position, move_time=None, *args, **kwargs):
+        key = joint_key(joint_name_or_num)
+        with self.lock:
+            self._maybe_resync()
+            if self.joints.get(key) == position:
+                return self._elide("move_joint")
+            self.stats["sent"] += 1
+            self.joints[key] = position
+            self.ready = False
+        call_args = (joint_name_or_num, position) + ((move_time,) if move_time is not None else ()) + args
+        return self._send(lambda: self.joints.pop(key, None), "move_joint", *call_args, **kwargs)
+
+    def arms(self, left_angle=0, right_angle=0, move_time=1000, *args, **kwargs):
+        with self.lock:
+            self._maybe_resync()
+            if self.joints.get("left arm") == left_angle and self.joints.get("right arm") == right_angle:
+                return self._elide("arms")
+            self.stats["sent"] += 1
+            self.joints["left arm"] = left_angle
+            self.joints["right arm"] = right_angle
+            self.ready = False
+
+        def forget():
+            self.joints.pop("left arm", None)
+            self.joints.pop("right arm", None)
+        return self._send(forget, "arms", left_angle, right_angle, move_time, *args, **kwargs)
+
+    def eyes(self, pose_or_angle="normal", move_time=1000, *args, **kwargs):
+        with self.lock:
+            self._maybe_resync()
+            if self.joints.get("eyes") == pose_or_angle:
+                return self._elide("eyes")
+            self.stats["sent"] += 1
+            self.joints["eyes"] = pose_or_angle
+            self.ready = False
+        return self._send(lambda: self.joints.pop("eyes", None), "eyes", pose_or_angle, move_time, *args, **kwargs)
+
+    def disco_color(self, color="white", *args, **kwargs):
+        # The LED state is tracked per add-on and region, i.e. per the remaining arguments
+        target = (args, tuple(sorted(kwargs.items())))
+        with self.lock:
+            self._maybe_resync()
+            if target in self.leds and self.leds[target] == color:
+                return self._elide("disco_color")
+            self.stats["sent"] += 1
+            self.leds[target] = color
+        return self._send(lambda: self.leds.pop(target, None), "disco_color", color, *args, **kwargs)
+
+    def set_volume(self, volume, *args, **kwargs):
+        with self.lock:
+            self._maybe_resync()
+            if self.volume == volume:
+                return self._elide("set_volume")
+            self.stats["sent"] += 1
+            self.volume = volume
+        return self._send(lambda: setattr(self, "volume", None), "set_volume", volume, *args, **kwargs)
+
+    def set_blocking(self, blocking):
+        with self.lock:
+            if self.blocking == blocking:
+                return self._elide("set_blocking")
+            self.stats["sent"] += 1
+            self.blocking = blocking
+        return self._send(lambda: setattr(self, "blocking", None), "set_blocking", blocking)
+
+    def __getattr__(self, name):
+        if name.startswith("__") or name == "marty":
+            raise AttributeError(name)
+        attribute = getattr(self.marty, name)
+        if not callable(attribute) or name in NON_MOTION_METHODS or name.startswith(("get_", "is_")):
+            return attribute
+
+        def motion(*args, **kwargs):
+            with self.lock:
+                # Any other command may move Marty, so the pose is no longer known
+                self.ready = False
+                self.joints.clear()
+                self.stats["sent"] += 1
+            return attribute(*args, **kwargs)
+        return motion
+
+    def report(self) -> dict:
+        with self.lock:
+            stats = dict(self.stats)
+            stats["elided_by_command"] = dict(stats["elided_by_command"])
+            total = stats["sent"] + stats["elided"]
+            stats["elided_share"] = round(stats["elided"] / total, 3) if total else 0.0
+            return stats
@@ -0,0 +1,274 @@
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+from pydub import AudioSegment
+from langchain_core.messages import AIMessage, messages_from_dict, messages_to_dict
+
+from transcriber import transcribe_audio
+
+TURNS_FILE = "turns.jsonl"
+AUDIO_DIR = "audio"
+
+class SessionRecorder:
+    """
+    Append-only store of conversation turns for a single session.
+
+    Each turn's raw microphone audio is written to its own FLAC (or raw PCM) file,
+    and everything else (transcript, LLM messages, tool calls and stage timings)
+    is appended as one JSON line to turns.jsonl once the turn is finished.
+    """
+
+    def __init__(self, root: str = "sessions", session_id: str = None, audio_format: str = "flac"):
+        if audio_format not in ("flac", "pcm"):
+            raise ValueError("audio_format must be 'flac' or 'pcm'")
+        self.session_id = session_id or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        self.session_dir = os.path.join(root, self.session_id)
+        self.audio_format = audio_format
+        os.makedirs(os.path.join(self.session_dir, AUDIO_DIR), exist_ok=True)
+        self.turn_index = len(load_session(self.session_dir))
+        self.turn = None
+        print(f"Recording session to {self.session_dir}")
+
+    def begin_turn(self) -> None:
+        """Start collecting data for a new turn"""
+        self.turn_index += 1
+        self.turn = {
+            "turn": self.turn_index,
+            "started_at": time.time(),
+            "audio": None,
+            "sample_rate": None,
+            "transcript": None,
+            "messages": [],
+            "response": None,
+            "tool_calls": [],
+            "tool_results": [],
+            "timings_ms": {},
+            "error": None,
+        }
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a pipeline stage of the current turn"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.turn is not None:
+                elapsed_ms = (time.perf_counter() - start_time) * 1000
+                self.turn["timings_ms"][name] = round(self.turn["timings_ms"].get(name, 0) + elapsed_ms, 2)
+
+    def log_audio(self, recording: np.ndarray, sample_rate: int) -> None:
+        """Save the raw 16-bit mono recording of the current turn"""
+        name = f"turn_{self.turn_index:04d}.{self.audio_format}"
+        path = os.path.join(self.session_dir, AUDIO_DIR, name)
+        if self.audio_format == "flac":
+            AudioSegment(
+                data=recording.astype(np.int16).tobytes(),
+                sample_width=2,
+                frame_rate=sample_rate,
+                channels=1,
+            ).export(path, format="flac")
+        else:
+            recording.astype(np.int16).tofile(path)
+        self.turn["audio"] = os.path.join(AUDIO_DIR, name)
+        self.turn["sample_rate"] = sample_rate
+
+    def log_transcript(self, transcript: str) -> None:
+        self.turn["transcript"] = transcript
+
+    def log_llm(self, chat_history: list, question: str, result: AIMessage) -> None:
+        """Record the messages sent to the assistant and the message it returned"""
+        self.turn["messages"] = messages_to_dict(chat_history)
+        self.turn["question"] = question
+        self.turn["response"] = messages_to_dict([result])[0]
+        self.turn["tool_calls"] = [{"name": call["name"], "args": call["args"]} for call in result.tool_calls]
+
+    def log_tool_results(self, tool_results: list) -> None:
+        self.turn["tool_results"] = [
+            {"tool_name": r.tool_name, "args": r.args, "result": str(r.result)} for r in tool_results
+        ]
+
+    def log_error(self, error: Exception) -> None:
+        self.turn["error"] = str(error)
+
+    def end_turn(self) -> None:
+        """Append the current turn to the session log"""
+        if self.turn is None:
+            return
+        with open(os.path.join(self.session_dir, TURNS_FILE), "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.turn) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.turn = None
+
+def load_session(session_dir: str) -> list:
+    """Return the list of recorded turns of a session (ignoring a partially written last line)"""
+    path = os.path.join(session_dir, TURNS_FILE)
+    turns = []
+    if not os.path.exists(path):
+        return turns
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                turns.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return turns
+
+def load_turn_audio(session_dir: str, turn: dict) -> np.ndarray:
+    """Load the raw 16-bit samples recorded for a turn"""
+    path = os.path.join(session_dir, turn["audio"])
+    if path.endswith(".pcm"):
+        return np.fromfile(path, dtype=np.int16)
+    segment = AudioSegment.from_file(path, format="flac")
+    return np.array(segment.get_array_of_samples(), dtype=np.int16)
+
+
+class StubMarty:
+    """Stand-in for martypy.Marty that accepts every command and returns immediately"""
+
+    def __init__(self, *args, **kwargs):
+        self.commands = []
+
+    def get_color_sensor_color(self, *args, **kwargs):
+        self.commands.append(("get_color_sensor_color", args, kwargs))
+        return "blue"
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        def command(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return True
+        return command
+
+class StubLLM:
+    """Chain stand-in that returns the recorded assistant response of each turn"""
+
+    def __init__(self, turns: list):
+        self.turns = turns
+        self.index = 0
+
+    def invoke(self, inputs, *args, **kwargs) -> AIMessage:
+        turn = self.turns[min(self.index, len(self.turns) - 1)]
+        if turn.get("response") is None:
+            return AIMessage(content="")
+        return messages_from_dict([turn["response"]])[0]
+
+def replay_session(session_dir: str, output_root: str = "replays", asr_model: str = "base") -> str:
+    """
+    Feed a recorded session back through agent.conversational_flow.
+
+    The microphone is replaced by the recorded audio, the LLM by the recorded
+    responses and the robot and speech synthesis (including the phrase bank and
+    streamed speech) by stubs, so only the code under test (ASR, prompt handling,
+    tool dispatch, speech chunking) contributes to the stage timings.
+    Transcription always runs in-process with asr_model, and the latency budget's
+    fillers, shortened replies and skipped gestures are turned off, so nothing
+    timing-dependent changes the result.
+    The replayed turns are written to a new session under output_root.
+
+    Returns:
+        str: Directory of the replayed session
+    """
+    turns = [turn for turn in load_session(session_dir) if turn.get("audio")]
+    if not turns:
+        raise ValueError(f"No recorded turns with audio in {session_dir}")
+
+    # Replace the robot before agent.py connects to it on import
+    import martypy
+    martypy.Marty = StubMarty
+    os.environ.setdefault("OPENAI_API_KEY", "replay")
+    import agent
+
+    stub_llm = StubLLM(turns)
+    replay = SessionRecorder(output_root, session_id=os.path.basename(os.path.normpath(session_dir)) + "-replay")
+
+    def replay_record_audio(duration=5, sample_rate=44100, **kwargs):
+        turn = turns[stub_llm.index]
+        recording = load_turn_audio(session_dir, turn)
+        AudioSegment(
+            data=recording.tobytes(),
+            sample_width=2,
+            frame_rate=turn["sample_rate"],
+            channels=1,
+        ).export("recording.mp3", format="mp3")
+        return recording, turn["sample_rate"]
+
+    def replay_transcribe(audio_file_path, model_name=None, use_worker=True, deadline_ms=None):
+        return transcribe_audio(audio_file_path, model_name=asr_model, use_worker=False)
+
+    agent.record_audio = replay_record_audio
+    agent.transcribe_audio = replay_transcribe
+    agent.turn_budget.asr_model = lambda audio_seconds, default="base": asr_model
+    # No timing-based degradation: the assistant is always waited for and replies are never shortened
+    agent.turn_budget.call = lambda name, fn, filler=None: fn()
+    agent.turn_budget.cap_reply = lambda text: text
+    agent.turn_budget.allow_gestures = lambda: True
+    agent.friendly_assistant = stub_llm
+    agent.get_storyteller_chain = lambda: stub_llm
+    # Speech is not synthesized during a replay
+    agent.speech_timer.say = lambda text, wait=False: 0.0
+    agent.phrase_bank.play = lambda name, wait=True: None
+    agent.phrase_bank.play_text = lambda text, wait=True: True
+    agent.streaming_speaker = None
+    agent.listen_gate = None
+    agent.speculator = None
+    # Only the replay is recorded, even if MARTY_SESSION_DIR started a recorder for this process
+    saved_recorder, saved_hooks = agent.session_recorder, list(agent.stage_hooks)
+    agent.session_recorder = replay
+    agent.stage_hooks[:] = [replay]
+    try:
+        for index in range(len(turns)):
+            stub_llm.index = index
+            agent.messages = messages_from_dict(turns[index].get("messages", []))
+            agent.conversational_flow()
+    finally:
+        agent.session_recorder = saved_recorder
+        agent.stage_hooks[:] = saved_hooks
+    return replay.session_dir
+
+def summarize_timings(session_dir: str) -> dict:
+    """Return the mean duration of each stage across the turns of a session, in milliseconds"""
+    totals = {}
+    for turn in load_session(session_dir):
+        for name, elapsed_ms in turn["timings_ms"].items():
+            totals.setdefault(name, []).append(elapsed_ms)
+    return {name: round(sum(values) / len(values), 2) for name, values in totals.items()}
+
+def compare_timings(baseline_dir: str, candidate_dir: str) -> None:
+    """Print the per-stage latency of two sessions side by side"""
+    baseline = summarize_timings(baseline_dir)
+    candidate = summarize_timings(candidate_dir)
+    print(f"{'stage':<20}{'baseline ms':>14}{'candidate ms':>14}{'change':>10}")
+    for name in sorted(set(baseline) | set(candidate)):
+        before, after = baseline.get(name), candidate.get(name)
+        change = f"{(after - before) / before * 100:+.1f}%" if before and after is not None else "-"
+        print(f"{name:<20}{before if before is not None else '-':>14}{after if after is not None else '-':>14}{change:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Marty sessions and compare stage latency")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    replay_parser = subparsers.add_parser("replay", help="Replay a recorded session with a stubbed LLM and robot")
+    replay_parser.add_argument("session_dir")
+    replay_parser.add_argument("-o", "--output", default="replays", help="Directory to write the replayed session to")
+    replay_parser.add_argument("-m", "--model", default="base", help="Whisper model used for every replayed turn")
+    compare_parser = subparsers.add_parser("compare", help="Compare stage timings of two sessions")
+    compare_parser.add_argument("baseline_dir")
+    compare_parser.add_argument("candidate_dir")
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        replay_dir = replay_session(args.session_dir, args.output, args.model)
+        compare_timings(args.session_dir, replay_dir)
+    else:
+        compare_timings(args.baseline_dir, args.candidate_dir)
+
+if __name__ == "__main__":
+    sys.exit(main())
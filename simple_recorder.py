@@ -5,8 +5,29 @@ import io
 import wave
 import time
 
-def record_audio(duration=5, sample_rate=44100, silence_threshold=-40, silence_duration=2):
-    """Record audio until silence is detected or max duration is reached"""
+def save_mp3(recording, sample_rate, path="recording.mp3"):
+    """Save a 16-bit mono recording as an MP3 file"""
+    # First save as WAV using wave module
+    with io.BytesIO() as wav_io:
+        with wave.open(wav_io, 'wb') as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)  # 16-bit audio
+            wav_file.setframerate(sample_rate)
+            wav_file.writeframes(recording.tobytes())
+        
+        # Convert WAV to AudioSegment
+        wav_io.seek(0)
+        audio_segment = AudioSegment.from_wav(wav_io)
+    
+    # Export as MP3
+    audio_segment.export(path, format="mp3")
+    print(f"Saved as {path}")
+
+def record_audio(duration=5, sample_rate=44100, silence_threshold=-40, silence_duration=2, on_chunk=None):
+    """Record audio until silence is detected or max duration is reached
+    
+    on_chunk, if given, is called with each recorded chunk and the sample rate while recording.
+    """
     print(f"Recording... (max duration: {duration} seconds)")
     
     # Calculate parameters
@@ -42,6 +63,8 @@ def record_audio(duration=5, sample_rate=44100, silence_threshold=-40, silence_d
                 silent_chunks = 0
                 
             chunks.append(chunk)
+            if on_chunk:
+                on_chunk(chunk, sample_rate)
             
     finally:
         stream.stop()
@@ -55,21 +78,7 @@ def record_audio(duration=5, sample_rate=44100, silence_threshold=-40, silence_d
     print("Recording finished!")
     print(f"Recorded {len(recording) / sample_rate:.2f} seconds of audio")
     
-    # First save as WAV using wave module
-    with io.BytesIO() as wav_io:
-        with wave.open(wav_io, 'wb') as wav_file:
-            wav_file.setnchannels(1)
-            wav_file.setsampwidth(2)  # 16-bit audio
-            wav_file.setframerate(sample_rate)
-            wav_file.writeframes(recording.tobytes())
-        
-        # Convert WAV to AudioSegment
-        wav_io.seek(0)
-        audio_segment = AudioSegment.from_wav(wav_io)
-    
-    # Export as MP3
-    audio_segment.export("recording.mp3", format="mp3")
-    print("Saved as recording.mp3")
+    save_mp3(recording, sample_rate)
 
     return recording, sample_rate
 
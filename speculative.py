@@ -0,0 +1,173 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+
+import numpy as np
+
+from transcriber import get_model
+
+# Whisper expects 16 kHz audio
+WHISPER_SAMPLE_RATE = 16000
+
+def normalize(text: str) -> str:
+    return " ".join("".join(c for c in text.lower() if c.isalnum() or c.isspace()).split())
+
+def similarity(a: str, b: str) -> float:
+    """Word-level similarity of two transcripts, from 0 (different) to 1 (identical)"""
+    return SequenceMatcher(None, normalize(a).split(), normalize(b).split()).ratio()
+
+class PartialTranscriber:
+    """
+    Produces partial transcripts while the child is still talking.
+
+    Recorded chunks are passed to feed(); every interval seconds a background thread
+    transcribes everything recorded so far with a small Whisper model and passes the
+    text to on_partial.
+    """
+
+    def __init__(self, on_partial, model_name: str = "tiny", interval: float = 0.5, min_audio: float = 0.8):
+        self.on_partial = on_partial
+        self.model_name = model_name
+        self.interval = interval
+        self.min_audio = min_audio
+        self.chunks = []
+        self.sample_rate = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def feed(self, chunk: np.ndarray, sample_rate: int) -> None:
+        with self.lock:
+            self.chunks.append(chunk)
+            self.sample_rate = sample_rate
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join(timeout=5)
+
+    def _audio_so_far(self):
+        with self.lock:
+            if not self.chunks:
+                return None
+            audio = np.concatenate(self.chunks).astype(np.float32) / 32768.0
+            sample_rate = self.sample_rate
+        if len(audio) < self.min_audio * sample_rate:
+            return None
+        # Resample to 16 kHz for Whisper
+        target_length = int(len(audio) * WHISPER_SAMPLE_RATE / sample_rate)
+        return np.interp(np.linspace(0, len(audio) - 1, target_length), np.arange(len(audio)), audio).astype(np.float32)
+
+    def _run(self) -> None:
+        model = get_model(self.model_name)
+        while not self.stopped.wait(self.interval):
+            audio = self._audio_so_far()
+            if audio is None:
+                continue
+            try:
+                text = model.transcribe(audio, fp16=False)["text"]
+            except Exception as e:
+                print(f"Partial transcription failed: {e}")
+                continue
+            self.on_partial(text)
+
+class SpeculativeResponder:
+    """
+    Starts the assistant request before the final transcript is ready.
+
+    Once the partial transcript has not changed for `stability` seconds, the request
+    is sent with the partial text. When the final transcript arrives it is compared
+    with the speculated one: if they match closely the speculative answer is used
+    (a hit, saving the time the request already ran), otherwise it is discarded and
+    the request is made again with the final text (a miss). If the partial text
+    changes while a speculation is running, a new one may be started instead.
+    Wasted calls are capped per turn and as a share of all turns.
+    """
+
+    def __init__(self, invoke, stability: float = 0.4, match_threshold: float = 0.9, max_per_turn: int = 2,
+                 max_waste_ratio: float = 0.5):
+        """
+        Args:
+            invoke: Callable sending the assistant request, taking {"question", "chat_history"}
+            stability (float): Seconds the partial transcript must stay the same before speculating
+            match_threshold (float): Minimum similarity between speculated and final text to use the answer
+            max_per_turn (int): Maximum speculative requests per turn
+            max_waste_ratio (float): Stop speculating while wasted requests exceed this share of turns
+        """
+        self.invoke = invoke
+        self.stability = stability
+        self.match_threshold = match_threshold
+        self.max_per_turn = max_per_turn
+        self.max_waste_ratio = max_waste_ratio
+        self.executor = ThreadPoolExecutor(max_workers=max_per_turn)
+        self.lock = threading.Lock()
+        self.stats = {"turns": 0, "speculations": 0, "hits": 0, "misses": 0, "wasted": 0, "latency_saved_s": 0.0}
+        self.begin_turn([])
+
+    def begin_turn(self, chat_history: list) -> None:
+        with self.lock:
+            self.chat_history = list(chat_history)
+            self.partial = ""
+            self.partial_since = time.monotonic()
+            self.speculation = None
+            self.turn_speculations = 0
+
+    def _budget_left(self) -> bool:
+        if self.turn_speculations >= self.max_per_turn:
+            return False
+        turns = max(1, self.stats["turns"])
+        return self.stats["wasted"] / turns < self.max_waste_ratio
+
+    def on_partial(self, text: str) -> None:
+        """Receive the latest partial transcript and speculate once it is stable"""
+        with self.lock:
+            if normalize(text) != normalize(self.partial):
+                self.partial = text
+                self.partial_since = time.monotonic()
+                return
+            if not normalize(text) or time.monotonic() - self.partial_since < self.stability:
+                return
+            if self.speculation and similarity(self.speculation["text"], text) >= self.match_threshold:
+                return
+            if not self._budget_left():
+                return
+            if self.speculation:
+                # The child kept talking: the running speculation will be wasted
+                self.stats["wasted"] += 1
+            self.turn_speculations += 1
+            self.stats["speculations"] += 1
+            inputs = {"question": text, "chat_history": self.chat_history}
+            speculation = {"text": text, "started": time.monotonic(), "future": self.executor.submit(self.invoke, inputs)}
+            speculation["future"].add_done_callback(lambda _: speculation.__setitem__("done", time.monotonic()))
+            self.speculation = speculation
+
+    def finish(self, final_text: str):
+        """Return the assistant response for the final transcript, using the speculation when it matches"""
+        final_at = time.monotonic()
+        with self.lock:
+            self.stats["turns"] += 1
+            speculation = self.speculation
+            self.speculation = None
+
+        if speculation and similarity(speculation["text"], final_text) >= self.match_threshold:
+            try:
+                result = speculation["future"].result()
+            except Exception as e:
+                print(f"Speculative request failed: {e}")
+            else:
+                # Without speculation the request would have started at final_at and taken just as long
+                duration = speculation.get("done", time.monotonic()) - speculation["started"]
+                self.stats["hits"] += 1
+                self.stats["latency_saved_s"] += min(duration, final_at - speculation["started"])
+                return result
+        if speculation:
+            self.stats["misses"] += 1
+            self.stats["wasted"] += 1
+        return self.invoke({"question": final_text, "chat_history": self.chat_history})
+
+    def report(self) -> dict:
+        stats = dict(self.stats)
+        stats["hit_rate"] = round(stats["hits"] / stats["speculations"], 2) if stats["speculations"] else 0.0
+        stats["latency_saved_s"] = round(stats["latency_saved_s"], 2)
+        return stats
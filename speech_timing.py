@@ -0,0 +1,146 @@
+import os
+import queue
+import tempfile
+import threading
+import time
+
+from pydub import AudioSegment
+
+from tts import text_to_speech
+
+def clip_duration(audio_file_path: str) -> float:
+    """Return the playback length of an MP3 file in seconds"""
+    return len(AudioSegment.from_mp3(audio_file_path)) / 1000.0
+
+class SpeechTimer:
+    """
+    Plays synthesized speech on Marty and knows exactly when each clip ends.
+
+    Every clip is synthesized before it is queued, so its real duration is known.
+    The next clip is synthesized while the previous one is still playing and is
+    sent start_latency seconds before the previous one finishes, so it starts
+    playing as that one ends, giving back-to-back speech with no dead air and
+    no overlap. Motions can be started with run_after_speech so
+    they begin when the speech ends.
+
+    martypy does not report when playback starts or ends, so every deadline is
+    computed from the clip durations and start_latency, an assumed value to tune
+    for the robot and network in use. Its play_mp3 streams the file and returns
+    only once the robot has taken all of it, so clips are streamed one at a time
+    on a background thread.
+    """
+
+    def __init__(self, marty, voice: str = "alloy", start_latency: float = 0.2, tts_cache=None):
+        """
+        Args:
+            marty: Connected Marty instance used to play the clips
+            voice (str): OpenAI TTS voice (alloy, echo, fable, onyx, nova, or shimmer)
+            start_latency (float): Assumed seconds between sending a clip and the robot starting to play it
+            tts_cache: Optional tts.TTSCache; cached clips are reused and never deleted
+        """
+        self.marty = marty
+        self.voice = voice
+        self.start_latency = start_latency
+        self.tts_cache = tts_cache
+        self.deadline = 0.0
+        self.lock = threading.Lock()
+        self.streams = queue.Queue()
+        threading.Thread(target=self._stream, daemon=True).start()
+
+    def remaining(self) -> float:
+        """Seconds until the clip currently playing is expected to end"""
+        return max(0.0, self.deadline - time.monotonic())
+
+    def wait(self) -> None:
+        """Block until the clip currently playing has finished"""
+        delay = self.remaining()
+        if delay > 0:
+            time.sleep(delay)
+
+    def say(self, text: str, wait: bool = False) -> float:
+        """
+        Synthesize text and play it as soon as the previous clip has finished.
+
+        Args:
+            text (str): The text Marty should say
+            wait (bool): Whether to block until this clip has finished playing
+
+        Returns:
+            float: Duration of the clip in seconds
+        """
+        if self.tts_cache is not None:
+            clip_file = self.tts_cache.get(text, self.voice)
+        else:
+            fd, clip_file = tempfile.mkstemp(suffix=".mp3", prefix="marty_speech_")
+            os.close(fd)
+            text_to_speech(text, voice=self.voice, output_file=clip_file)
+        return self.play(clip_file, wait=wait, delete_after=self.tts_cache is None)
+
+    def play(self, clip_file: str, duration: float = None, wait: bool = False, delete_after: bool = False,
+             on_sent=None) -> float:
+        """
+        Play an MP3 file as soon as the previous clip has finished.
+
+        Args:
+            clip_file (str): MP3 file to play
+            duration (float): Length of the clip in seconds (read from the file if not given)
+            wait (bool): Whether to block until this clip has finished playing
+            delete_after (bool): Delete the file once it has been streamed
+            on_sent: Optional callable given the seconds the transfer to the robot took
+
+        Returns:
+            float: Duration of the clip in seconds
+        """
+        if duration is None:
+            duration = clip_duration(clip_file)
+        self.play_command(lambda: self.stream(clip_file, on_sent, delete_after), duration, wait)
+        return duration
+
+    def play_command(self, send, duration: float, wait: bool = False) -> None:
+        """
+        Send a playback command so it starts the moment the previous clip finishes.
+
+        The command is sent start_latency seconds before the previous clip's deadline,
+        so the robot's start-up time overlaps the end of that clip instead of leaving
+        a gap after it.
+
+        Args:
+            send: Callable that starts playback on the robot without blocking
+            duration (float): Length of the audio it plays in seconds
+            wait (bool): Whether to block until it has finished playing
+        """
+        with self.lock:
+            delay = self.deadline - self.start_latency - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            send()
+            # Playback starts after the start-up time, but never before the previous clip has ended
+            self.deadline = max(time.monotonic() + self.start_latency, self.deadline) + duration
+
+        if wait:
+            self.wait()
+
+    def stream(self, clip_file: str, on_sent=None, delete_after: bool = False) -> None:
+        """Stream an MP3 file to the robot on the background thread, after the clips queued before it"""
+        self.streams.put((clip_file, on_sent, delete_after))
+
+    def _stream(self) -> None:
+        while True:
+            clip_file, on_sent, delete_after = self.streams.get()
+            send_start = time.perf_counter()
+            try:
+                self.marty.play_mp3(clip_file)
+                if on_sent is not None:
+                    on_sent(time.perf_counter() - send_start)
+            except Exception as e:
+                print(f"Could not play {clip_file}: {e}")
+            if delete_after:
+                try:
+                    os.remove(clip_file)
+                except OSError:
+                    pass
+
+    def run_after_speech(self, action, *args, **kwargs):
+        """Wait for the current clip to finish, then run a motion or other action"""
+        self.wait()
+        return action(*args, **kwargs)
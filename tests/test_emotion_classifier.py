@@ -0,0 +1,19 @@
+import pytest
+
+from emotion_classifier import REGRESSION_CASES, TEST_CASES, classify_emotion, express_emotion
+
+
+@pytest.mark.parametrize("text, expected", TEST_CASES + REGRESSION_CASES)
+def test_classify_emotion(text, expected):
+    assert classify_emotion(text).emotion == expected
+
+
+def test_gestures_are_sent_with_explicit_arguments():
+    calls = []
+
+    class RecordingMarty:
+        def __getattr__(self, name):
+            return lambda *args, **kwargs: calls.append((name, args, kwargs))
+
+    express_emotion(RecordingMarty(), "sad")
+    assert ("arms", (-30, -30, 1500), {"blocking": False}) in calls
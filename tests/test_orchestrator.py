@@ -0,0 +1,72 @@
+import threading
+import time
+
+from langchain_core.messages import AIMessage
+
+from func_def import ROBOT_TOOLS
+from orchestrator import (
+    ROBOT_ACTIONS, FairASRScheduler, Orchestrator, SharedResources, SimulatedMarty, robot_tool_specs, simulate,
+)
+
+
+def test_simulate_serves_every_session_equally():
+    report = simulate(num_sessions=3, turns=4, asr_delay=0.01, llm_delay=0.01)
+
+    assert sorted(report) == ["marty-0", "marty-1", "marty-2"]
+    for stats in report.values():
+        assert stats["turns"] == 4
+        assert stats["asr_jobs"] == 4
+        latency = stats["latency_ms"]
+        for stage in ("asr", "assistant", "turn"):
+            assert latency[stage]["count"] == 4
+            assert 0 < latency[stage]["p50"] <= latency[stage]["p95"]
+
+
+def test_scheduler_round_robins_between_sessions():
+    order = []
+    release = threading.Event()
+
+    def transcribe(audio_file_path):
+        release.wait()
+        order.append(audio_file_path)
+        return audio_file_path
+
+    scheduler = FairASRScheduler(transcribe, workers=1)
+    # The worker picks up the first job and blocks on it while the rest are queued
+    futures = [scheduler.submit("chatty", "chatty-0")]
+    time.sleep(0.05)
+    futures += [scheduler.submit("chatty", f"chatty-{i}") for i in range(1, 4)]
+    futures.append(scheduler.submit("quiet", "quiet-0"))
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+    scheduler.close()
+
+    # The quiet session is served right after the chatty one's next job, not after all of them
+    assert order.index("quiet-0") == 2
+    assert scheduler.served == {"chatty": 4, "quiet": 1}
+
+
+def test_every_shared_tool_has_an_action():
+    assert list(ROBOT_ACTIONS) == list(ROBOT_TOOLS)
+    names = [spec["function"]["name"] for spec in robot_tool_specs()]
+    assert "disco_color" in names and "select_color_and_tell_story" in names
+
+
+def test_color_story_is_told_from_the_detected_color():
+    class Storyteller:
+        def invoke(self, inputs):
+            return AIMessage(content=f"A {inputs['emotion']} story")
+
+    class ColorMarty(SimulatedMarty):
+        def get_color_sensor_color(self, side):
+            return "blue"
+
+    spoken = []
+    resources = SharedResources(transcribe=lambda path: "", assistant=object(), storyteller=Storyteller())
+    session = Orchestrator(resources).add_session("marty", ColorMarty("marty"), listen=lambda: None, speak=spoken.append)
+    Orchestrator(resources).dispatch_tool(session, {"name": "select_color_and_tell_story", "args": {}, "id": "1"})
+    resources.asr.close()
+
+    assert spoken == ["A Magic story"]
+    assert session.break_loop
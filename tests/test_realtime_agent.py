@@ -0,0 +1,77 @@
+import base64
+import json
+import threading
+import time
+
+from websockets.sync.server import serve
+
+from realtime_agent import SAMPLE_RATE, RealtimeSession
+
+
+class FakeMarty:
+    def __init__(self):
+        self.played = []
+
+    def play_mp3(self, clip_file, blocking=False):
+        self.played.append(clip_file)
+
+
+def mock_realtime_server(received, done):
+    """Play one reply, then talk over the next one and wait for the client to cancel it"""
+    def handler(ws):
+        received.append(json.loads(ws.recv()))
+        # One 400 ms player segment, and half of one that stays buffered until the reply ends
+        segment = base64.b64encode(b"\x00\x00" * (SAMPLE_RATE * 400 // 1000)).decode("ascii")
+        partial = base64.b64encode(b"\x00\x00" * (SAMPLE_RATE * 200 // 1000)).decode("ascii")
+        for event in [
+            {"type": "input_audio_buffer.speech_stopped"},
+            {"type": "response.created"},
+            {"type": "response.audio.delta", "delta": segment},
+            {"type": "response.audio.done"},
+            {"type": "response.done"},
+        ]:
+            ws.send(json.dumps(event))
+        time.sleep(1.0)
+        ws.send(json.dumps({"type": "response.created"}))
+        ws.send(json.dumps({"type": "response.audio.delta", "delta": partial}))
+        ws.send(json.dumps({"type": "input_audio_buffer.speech_started"}))
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            try:
+                event = json.loads(ws.recv(timeout=0.5))
+            except TimeoutError:
+                continue
+            received.append(event)
+            if event["type"] == "response.cancel":
+                break
+        done.set()
+        # Keep the connection open until the client hangs up
+        try:
+            while True:
+                ws.recv()
+        except Exception:
+            pass
+
+    return serve(handler, "127.0.0.1", 0)
+
+
+def test_session_plays_replies_and_cancels_when_interrupted():
+    received = []
+    done = threading.Event()
+    server = mock_realtime_server(received, done)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.socket.getsockname()[1]
+    marty = FakeMarty()
+
+    session = RealtimeSession([], marty, url=f"ws://127.0.0.1:{port}", microphone=False, should_stop=done.is_set)
+    try:
+        session.run()
+    finally:
+        server.shutdown()
+
+    assert received[0]["type"] == "session.update"
+    assert any(event["type"] == "response.cancel" for event in received)
+    assert len(session.turn_latencies) == 1
+    # Only the first reply was played; the interrupted one was dropped
+    assert len(marty.played) == 1
+    assert not session.player.buffer
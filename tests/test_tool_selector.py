@@ -0,0 +1,25 @@
+import pytest
+from langchain_core.tools import tool
+
+from tool_selector import ToolSelector
+
+
+@tool
+def disco_color(color: str = "green"):
+    """Tool to control Marty's disco LED lights"""
+
+
+@tool
+def select_color_and_tell_story():
+    """When the user asks Marty to select a color and tell a story, this tool is used."""
+
+
+@tool
+def exit_program():
+    """Tool to exit the program"""
+
+
+@pytest.mark.parametrize("text", ["Change your color to red", "Change your colour to red"])
+def test_both_spellings_of_color_select_the_color_tools(text):
+    selector = ToolSelector([select_color_and_tell_story, exit_program, disco_color])
+    assert selector.select(text) == ["select_color_and_tell_story", "exit_program", "disco_color"]
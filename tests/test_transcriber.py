@@ -0,0 +1,30 @@
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import transcriber
+from asr_server import TranscriptionRequest, make_handler
+
+
+class StalledTranscriber:
+    """Worker-side transcriber whose requests never finish"""
+    model_name = "base"
+
+    def submit(self, audio_file_path, deadline_ms):
+        return TranscriptionRequest(audio_file_path, time.monotonic() + deadline_ms / 1000)
+
+
+def test_stalled_worker_falls_back_to_local(tmp_path):
+    audio_file_path = tmp_path / "recording.mp3"
+    audio_file_path.write_bytes(b"")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(StalledTranscriber()))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    worker_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        # The worker answers 504 once the deadline passes, before the client's own timeout
+        assert transcriber.transcribe_with_worker(str(audio_file_path), deadline_ms=200, worker_url=worker_url) is None
+        # A busy worker is not marked as down
+        assert time.monotonic() >= transcriber._worker_down_until
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,160 @@
+import json
+import re
+import threading
+
+from langchain_core.runnables import RunnableLambda
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _encoding = None
+
+# Tools are offered in bundles so only a handful of distinct tool lists are ever sent,
+# which keeps request prefixes identical across turns for provider prompt caching.
+# Bundle name -> (tool names, keywords; a keyword ending in "*" matches as a prefix)
+TOOL_BUNDLES = {
+    "control": (["exit_program"], []),
+    "story": (["select_color_and_tell_story"], ["story", "stories", "tale", "tell", "colo*", "book", "read*"]),
+    "walking": (["walk", "sidestep", "get_ready"],
+                ["walk*", "step*", "move", "come", "go", "forward", "sideways", "side", "ready", "stand*", "run*"]),
+    "dancing": (["dance", "circle_dance", "wiggle", "celebrate"],
+                ["danc*", "spin*", "circle", "wiggl*", "celebrat*", "party", "music", "song", "boogie", "shake", "fun"]),
+    "gestures": (["wave", "arms", "kick", "lean", "move_joint"],
+                 ["wav*", "hello", "hi", "bye", "arm*", "hand*", "kick*", "ball", "football", "lean*", "joint", "leg*", "knee", "hip"]),
+    "expression": (["eyes", "disco_color"],
+                   ["eye*", "look*", "face", "light*", "led*", "colo*", "red", "blue", "green", "yellow", "purple",
+                    "white", "angry", "excited", "wide", "disco"]),
+}
+# Bundles offered on every turn (exit_program is tiny and must always work)
+ALWAYS_BUNDLES = ["control"]
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken when installed, otherwise the usual 4 characters per token estimate"""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return max(1, len(text) // 4)
+
+def _strip_descriptions(schema):
+    if isinstance(schema, dict):
+        return {key: _strip_descriptions(value) for key, value in schema.items() if key not in ("description", "title")}
+    if isinstance(schema, list):
+        return [_strip_descriptions(value) for value in schema]
+    return schema
+
+def compact_tool_spec(tool) -> dict:
+    """
+    OpenAI function spec of a tool with its docstring shortened to one line.
+
+    The multi-line Args section is folded into a short list of argument keys with
+    their defaults, and descriptions and titles are dropped from the JSON schema.
+    """
+    spec = convert_to_openai_tool(tool)
+    function = spec["function"]
+    doc = getattr(tool, "description", None) or function.get("description", "")
+    lines = [line.strip() for line in doc.splitlines() if line.strip()]
+    summary = lines[0] if lines else function["name"]
+
+    keys = []
+    for line in lines[1:]:
+        match = re.match(r"(\w+)(?: \(\w+\))?:.*\(default: (.*)\)$", line)
+        if match:
+            keys.append(f"{match.group(1)}={match.group(2)}")
+    properties = list(function.get("parameters", {}).get("properties", {}))
+    if keys and properties:
+        summary = f"{summary.rstrip('.')}. {properties[0]} keys: {', '.join(keys)}"
+
+    return {"type": "function", "function": {
+        "name": function["name"],
+        "description": summary,
+        "parameters": _strip_descriptions(function.get("parameters", {"type": "object", "properties": {}})),
+    }}
+
+def _keyword_matches(keyword: str, words: set) -> bool:
+    if keyword.endswith("*"):
+        return any(word.startswith(keyword[:-1]) for word in words)
+    return keyword in words
+
+class ToolSelector:
+    """
+    Picks the tools worth sending for a turn, with compact schemas.
+
+    Each bundle of tools is scored by how many of its keywords appear in the
+    child's words; bundles with a score of at least min_score are offered, plus the
+    ALWAYS_BUNDLES. Tools keep the order of the original list, so the same selection
+    always produces the same request prefix. Prompt tokens of the full tool list
+    and of the selected compact list are counted on every turn.
+    """
+
+    def __init__(self, tools: list, bundles: dict = TOOL_BUNDLES, always: list = ALWAYS_BUNDLES, min_score: int = 1):
+        """
+        Args:
+            tools (list): All tools the assistant may call
+            bundles (dict): Bundle name -> (tool names, keywords)
+            always (list): Bundles offered on every turn
+            min_score (int): Keyword hits needed to offer a bundle
+        """
+        self.tools = tools
+        self.bundles = bundles
+        self.always = always
+        self.min_score = min_score
+        self.specs = {tool.name: compact_tool_spec(tool) for tool in tools}
+        self.full_tokens = count_tokens(json.dumps([convert_to_openai_tool(tool) for tool in tools]))
+        self.chains = {}
+        self.lock = threading.Lock()
+        self.stats = {"turns": 0, "full_tokens": 0, "sent_tokens": 0, "selections": {}}
+
+        bundled = {name for names, _ in bundles.values() for name in names}
+        # Tools missing from every bundle are always offered rather than silently dropped
+        self.unbundled = [tool.name for tool in tools if tool.name not in bundled]
+
+    def select(self, text: str) -> list:
+        """Names of the tools relevant to the text, in the original tool order"""
+        words = set(re.findall(r"[a-z']+", text.lower()))
+        chosen = set(self.unbundled)
+        for bundle, (names, keywords) in self.bundles.items():
+            score = sum(1 for keyword in keywords if _keyword_matches(keyword, words))
+            if bundle in self.always or score >= self.min_score:
+                chosen.update(names)
+        return [tool.name for tool in self.tools if tool.name in chosen]
+
+    def tool_specs(self, names: list) -> list:
+        return [self.specs[name] for name in names]
+
+    def record(self, names: list) -> int:
+        """Count the tokens sent for a selection and return the tokens saved"""
+        sent = count_tokens(json.dumps(self.tool_specs(names)))
+        self.stats["turns"] += 1
+        self.stats["full_tokens"] += self.full_tokens
+        self.stats["sent_tokens"] += sent
+        key = ",".join(names)
+        self.stats["selections"][key] = self.stats["selections"].get(key, 0) + 1
+        return self.full_tokens - sent
+
+    def chain(self, template, bind_tools, text_key: str = "question"):
+        """
+        Return a runnable that formats the template and calls the model with the selected compact tools.
+
+        Args:
+            template: Prompt template of the chain
+            bind_tools: Callable taking a list of tool specs and returning a runnable (e.g. ModelRouter.bind_tools)
+            text_key (str): Template input holding the child's words
+        """
+        def invoke(inputs):
+            names = self.select(inputs.get(text_key, ""))
+            with self.lock:
+                key = tuple(names)
+                if key not in self.chains:
+                    self.chains[key] = template | bind_tools(self.tool_specs(names))
+                saved = self.record(names)
+            print(f"Tools for this turn: {', '.join(names)} ({saved} prompt tokens saved)")
+            return self.chains[key].invoke(inputs)
+        return RunnableLambda(invoke, name="tool_selector")
+
+    def report(self) -> dict:
+        stats = dict(self.stats)
+        stats["tokens_saved"] = stats["full_tokens"] - stats["sent_tokens"]
+        stats["mean_tokens_saved_per_turn"] = round(stats["tokens_saved"] / stats["turns"], 1) if stats["turns"] else 0.0
+        stats["distinct_tool_lists"] = len(stats["selections"])
+        return stats
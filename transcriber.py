@@ -1,13 +1,99 @@
 import whisper
 import os
+import json
+import time
+import urllib.error
+import urllib.request
 
-def transcribe_audio(audio_file_path: str, model_name: str = "base") -> str:
+# Loaded Whisper models, keyed by model name, so each process only loads a model once
+_models = {}
+# Where the last transcribe_audio call ran: "worker", "local", or "local_cold" when the model was loaded for it
+last_backend = None
+
+def get_model(model_name: str = "base"):
+    """
+    Return the Whisper model with the given name, loading it on first use.
+    
+    Args:
+        model_name (str): Whisper model to use (tiny, base, small, medium, large)
+    
+    Returns:
+        The loaded Whisper model
+    """
+    if model_name not in _models:
+        _models[model_name] = whisper.load_model(model_name)
+    return _models[model_name]
+
+# Address of the local ASR worker started with asr_server.py
+ASR_WORKER_URL = os.getenv("ASR_WORKER_URL", "http://127.0.0.1:8765")
+
+# How long to stop trying the worker after it could not be reached
+WORKER_RETRY_SECONDS = 30
+_worker_down_until = 0.0
+# Model the worker was started with, learned from its replies
+_worker_model = None
+
+def transcribe_with_worker(audio_file_path: str, deadline_ms: int = 10000, worker_url: str = ASR_WORKER_URL,
+                           model_name: str = "base"):
+    """
+    Transcribe an audio file using the local ASR worker (see asr_server.py).
+    
+    Args:
+        audio_file_path (str): Path to the audio file to transcribe
+        deadline_ms (int): How long the worker may take before giving up, in milliseconds
+        worker_url (str): Base URL of the worker
+        model_name (str): Whisper model the audio must be transcribed with
+    
+    Returns:
+        str: Transcribed text, or None if the worker is not available, serves a
+        different model or did not answer in time
+    
+    Raises:
+        Exception: If the worker is available but the transcription failed
+    """
+    global _worker_down_until, _worker_model
+    if time.monotonic() < _worker_down_until:
+        return None
+    if _worker_model is not None and _worker_model != model_name:
+        return None
+
+    body = json.dumps({"path": os.path.abspath(audio_file_path), "deadline_ms": deadline_ms, "model": model_name}).encode("utf-8")
+    request = urllib.request.Request(worker_url + "/transcribe", data=body, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=deadline_ms / 1000 + 1) as response:
+            reply = json.loads(response.read())
+            _worker_model = reply.get("model", model_name)
+            return reply["text"]
+    except urllib.error.HTTPError as e:
+        reply = e.read().decode("utf-8", "replace")
+        if e.code == 409:
+            # The worker serves another model; transcribe this model locally
+            _worker_model = json.loads(reply).get("model")
+            return None
+        if e.code in (503, 504):
+            # The worker is up but busy or ran past the deadline: transcribe this clip locally and keep using the worker
+            return None
+        raise Exception(f"ASR worker error: {reply}")
+    except TimeoutError:
+        # The worker is up but busy: transcribe this clip locally and keep using the worker
+        return None
+    except (urllib.error.URLError, ConnectionError) as e:
+        if isinstance(getattr(e, "reason", None), TimeoutError):
+            return None
+        # Worker not running, transcribe locally for a while before trying again
+        _worker_down_until = time.monotonic() + WORKER_RETRY_SECONDS
+        _worker_model = None
+        return None
+
+def transcribe_audio(audio_file_path: str, model_name: str = "base", use_worker: bool = True, deadline_ms: int = 10000) -> str:
     """
     Transcribe an audio file using OpenAI's Whisper model.
     
     Args:
         audio_file_path (str): Path to the audio file to transcribe
         model_name (str): Whisper model to use (tiny, base, small, medium, large)
+        use_worker (bool): Use the local ASR worker when it is running
+        deadline_ms (int): How long the worker may take, in milliseconds
     
     Returns:
         str: Transcribed text from the audio file
@@ -24,9 +110,17 @@ def transcribe_audio(audio_file_path: str, model_name: str = "base") -> str:
     if not audio_file_path.lower().endswith('.mp3'):
         raise ValueError("File must be an MP3 file")
     
+    global last_backend
+    if use_worker:
+        text = transcribe_with_worker(audio_file_path, deadline_ms, model_name=model_name)
+        if text is not None:
+            last_backend = "worker"
+            return text
+
+    last_backend = "local" if model_name in _models else "local_cold"
     try:
-        # Load the Whisper model
-        model = whisper.load_model(model_name)
+        # Load the Whisper model (cached after the first call)
+        model = get_model(model_name)
         
         # Transcribe the audio
         result = model.transcribe(audio_file_path)
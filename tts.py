@@ -1,10 +1,16 @@
-from openai import OpenAI
+import hashlib
+import os
+import threading
+
 from pydub import AudioSegment
 
+from http_clients import get_openai_client, call_with_retries
+
 from dotenv import load_dotenv
 load_dotenv()
 
-def text_to_speech(text: str, voice: str = "alloy", output_file: str = "output.mp3", bitrate: str = "64k") -> None:
+def text_to_speech(text: str, voice: str = "alloy", output_file: str = "output.mp3", bitrate: str = "64k",
+                   deadline: float = 10.0, hedge: bool = False) -> None:
     """
     Convert text to speech using OpenAI's TTS API.
     
@@ -12,21 +18,24 @@ def text_to_speech(text: str, voice: str = "alloy", output_file: str = "output.m
         text (str): The text to convert to speech
         voice (str): The voice to use (alloy, echo, fable, onyx, nova, or shimmer)
         output_file (str): Path where the audio file will be saved
+        bitrate (str): Bitrate of the compressed MP3
+        deadline (float): Seconds allowed for the request, including retries
+        hedge (bool): Send a second request if the first is slow and use whichever answers first
         
     Returns:
         None
     """
     try:
-        client = OpenAI()
+        client = get_openai_client()
         
-        # Create temporary file for initial output
-        temp_file = "temp_output.mp3"
+        # Create temporary file for initial output (next to the output so concurrent calls don't collide)
+        temp_file = output_file + ".raw"
         
-        response = client.audio.speech.create(
+        response = call_with_retries(lambda timeout: client.with_options(timeout=timeout).audio.speech.create(
             model="tts-1",
             voice=voice,
             input=text
-        )
+        ), hedge_after=deadline / 2 if hedge else None, deadline=deadline)
         
         response.write_to_file(temp_file)
         
@@ -35,13 +44,53 @@ def text_to_speech(text: str, voice: str = "alloy", output_file: str = "output.m
         audio.export(output_file, format="mp3", bitrate=bitrate)
         
         # Clean up temporary file
-        import os
         os.remove(temp_file)
         
     except Exception as e:
         raise Exception(f"Error during text-to-speech conversion: {str(e)}")
 
 
+class TTSCache:
+    """
+    On-disk cache of synthesized speech, keyed by voice and text.
+
+    Shared between robot sessions so a phrase is only synthesized once.
+    """
+
+    def __init__(self, cache_dir: str = "tts_cache", voice: str = "alloy", bitrate: str = "64k"):
+        self.cache_dir = cache_dir
+        self.voice = voice
+        self.bitrate = bitrate
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, text: str, voice: str = None) -> str:
+        key = hashlib.sha256(f"{voice or self.voice}|{self.bitrate}|{text}".encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.cache_dir, key + ".mp3")
+
+    def get(self, text: str, voice: str = None) -> str:
+        """Return the path of an MP3 of the text, synthesizing it on a cache miss"""
+        path = self.path_for(text, voice)
+        with self.lock:
+            key_lock = self.key_locks.setdefault(path, threading.Lock())
+        # Only callers asking for the same phrase wait on each other
+        with key_lock:
+            if os.path.exists(path):
+                with self.lock:
+                    self.hits += 1
+                return path
+            with self.lock:
+                self.misses += 1
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Synthesize into a temp file and rename, so readers never see a partial file
+            temp_path = path + ".tmp.mp3"
+            text_to_speech(text, voice or self.voice, temp_path, self.bitrate)
+            os.replace(temp_path, path)
+            return path
+
+
 # if __name__ == "__main__":
 #     from dotenv import load_dotenv
 #     load_dotenv()